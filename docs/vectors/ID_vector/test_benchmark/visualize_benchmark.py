@@ -3,7 +3,17 @@
 Benchmark Visualization for ID_vector Performance Comparison
 """
 
+import os
+import sys
 import pandas as pd
+import matplotlib
+
+# Headless runs (no X11 or Wayland display) render straight to PNG with Agg
+HEADLESS = (sys.platform.startswith('linux')
+            and not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY'))
+if HEADLESS:
+    matplotlib.use('Agg')
+
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
@@ -22,9 +32,28 @@ def load_benchmark_data():
         print("Error: benchmark_results.csv not found. Please run the benchmark first.")
         return None
 
-def create_performance_comparison(df):
+def box_stats(series, label):
+    """Pre-aggregated box plot stats (quartiles, 1.5*IQR whiskers, fliers) for ax.bxp"""
+    values = np.asarray(series, dtype=float)
+    q1, med, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    return {'label': label, 'med': med, 'q1': q1, 'q3': q3,
+            'whislo': inside.min(), 'whishi': inside.max(),
+            'fliers': values[(values < inside.min()) | (values > inside.max())]}
+
+def subplots_2x2(fig, figsize):
+    """2x2 axes on a new figure, or on `fig` after clearing it for reuse"""
+    if fig is None:
+        fig = plt.figure(figsize=figsize, constrained_layout=True)
+    else:
+        fig.clear()
+        fig.set_size_inches(figsize)
+    return fig, fig.subplots(2, 2)
+
+def create_performance_comparison(df, fig=None):
     """Create performance comparison charts"""
-    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
+    fig, ((ax1, ax2), (ax3, ax4)) = subplots_2x2(fig, (16, 12))
     
     # 1. Execution Time Comparison (log scale)
     test_names = [name.replace(' (BPV=1)', '').replace(' (BPV=2)', '') for name in df['Test_Name']]
@@ -60,8 +89,8 @@ def create_performance_comparison(df):
     ax2.grid(True, alpha=0.3)
     
     # 3. Speedup Factors
-    ax3.bar(x - width/2, df['Speedup_vs_unordered_set_s'], width, label='vs unordered_set_s', alpha=0.8)
-    ax3.bar(x + width/2, df['Speedup_vs_vector'], width, label='vs std::vector', alpha=0.8)
+    bars_us = ax3.bar(x - width/2, df['Speedup_vs_unordered_set_s'], width, label='vs unordered_set_s', alpha=0.8)
+    bars_v = ax3.bar(x + width/2, df['Speedup_vs_vector'], width, label='vs std::vector', alpha=0.8)
     
     ax3.set_xlabel('Test Cases')
     ax3.set_ylabel('Speedup Factor (times faster)')
@@ -72,13 +101,12 @@ def create_performance_comparison(df):
     ax3.grid(True, alpha=0.3)
     
     # Add value labels on bars
-    for i, (v1, v2) in enumerate(zip(df['Speedup_vs_unordered_set_s'], df['Speedup_vs_vector'])):
-        ax3.text(i - width/2, v1 + 1, f'{v1:.1f}x', ha='center', va='bottom', fontsize=8)
-        ax3.text(i + width/2, v2 + 1, f'{v2:.1f}x', ha='center', va='bottom', fontsize=8)
+    ax3.bar_label(bars_us, labels=df['Speedup_vs_unordered_set_s'].map('{:.1f}x'.format).tolist(), padding=3, fontsize=8)
+    ax3.bar_label(bars_v, labels=df['Speedup_vs_vector'].map('{:.1f}x'.format).tolist(), padding=3, fontsize=8)
     
     # 4. Memory Efficiency Ratios
-    ax4.bar(x - width/2, df['Memory_Ratio_vs_unordered_set_s'], width, label='vs unordered_set_s', alpha=0.8)
-    ax4.bar(x + width/2, df['Memory_Ratio_vs_vector'], width, label='vs std::vector', alpha=0.8)
+    bars_us = ax4.bar(x - width/2, df['Memory_Ratio_vs_unordered_set_s'], width, label='vs unordered_set_s', alpha=0.8)
+    bars_v = ax4.bar(x + width/2, df['Memory_Ratio_vs_vector'], width, label='vs std::vector', alpha=0.8)
     
     ax4.set_xlabel('Test Cases')
     ax4.set_ylabel('Memory Ratio (ID_vector / other)')
@@ -89,18 +117,16 @@ def create_performance_comparison(df):
     ax4.grid(True, alpha=0.3)
     
     # Add percentage labels
-    for i, (v1, v2) in enumerate(zip(df['Memory_Ratio_vs_unordered_set_s'], df['Memory_Ratio_vs_vector'])):
-        ax4.text(i - width/2, v1 + 0.05, f'{v1*100:.1f}%', ha='center', va='bottom', fontsize=8)
-        ax4.text(i + width/2, v2 + 0.05, f'{v2*100:.1f}%', ha='center', va='bottom', fontsize=8)
+    ax4.bar_label(bars_us, labels=(df['Memory_Ratio_vs_unordered_set_s'] * 100).map('{:.1f}%'.format).tolist(), padding=3, fontsize=8)
+    ax4.bar_label(bars_v, labels=(df['Memory_Ratio_vs_vector'] * 100).map('{:.1f}%'.format).tolist(), padding=3, fontsize=8)
     
-    plt.tight_layout()
-    plt.savefig('../images/performance_comparison.png', dpi=300, bbox_inches='tight')
+    fig.savefig('../images/performance_comparison.png', dpi=300, bbox_inches='tight')
     print("Performance comparison chart saved as 'performance_comparison.png'")
     return fig
 
-def create_summary_statistics(df):
+def create_summary_statistics(df, fig=None):
     """Create summary statistics visualization"""
-    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(14, 10))
+    fig, ((ax1, ax2), (ax3, ax4)) = subplots_2x2(fig, (14, 10))
     
     # 1. Average Performance Metrics
     metrics = ['Speed vs unordered_set_s', 'Speed vs std::vector', 
@@ -120,25 +146,13 @@ def create_summary_statistics(df):
     ax1.tick_params(axis='x', rotation=45)
     
     # Add value labels
-    for i, (bar, value) in enumerate(zip(bars, values)):
-        height = bar.get_height()
-        if 'Speed' in metrics[i]:
-            ax1.text(bar.get_x() + bar.get_width()/2., height + 0.5, 
-                    f'{value:.1f}x', ha='center', va='bottom', fontweight='bold')
-        else:
-            ax1.text(bar.get_x() + bar.get_width()/2., height + 0.02, 
-                    f'{value:.3f}\n({value*100:.1f}%)', ha='center', va='bottom', fontweight='bold')
+    value_labels = [f'{speed_us_avg:.1f}x', f'{speed_v_avg:.1f}x',
+                    f'{mem_us_avg:.3f}\n({mem_us_avg*100:.1f}%)', f'{mem_v_avg:.3f}\n({mem_v_avg*100:.1f}%)']
+    ax1.bar_label(bars, labels=value_labels, padding=3, fontweight='bold')
     
     # 2. Performance Distribution
-    performance_data = []
-    labels = []
-    
-    for _, row in df.iterrows():
-        performance_data.extend([row['Speedup_vs_unordered_set_s'], row['Speedup_vs_vector']])
-        labels.extend(['vs unordered_set_s', 'vs std::vector'])
-    
-    ax2.boxplot([df['Speedup_vs_unordered_set_s'], df['Speedup_vs_vector']], 
-                labels=['vs unordered_set_s', 'vs std::vector'])
+    ax2.bxp([box_stats(df['Speedup_vs_unordered_set_s'], 'vs unordered_set_s'),
+             box_stats(df['Speedup_vs_vector'], 'vs std::vector')])
     ax2.set_title('Speedup Distribution')
     ax2.set_ylabel('Speedup Factor')
     ax2.grid(True, alpha=0.3)
@@ -166,14 +180,13 @@ def create_summary_statistics(df):
                 autopct='%1.1f%%', startangle=90, colors=['lightyellow', 'lightcoral'])
     ax4.set_title('Memory Usage vs std::vector')
     
-    plt.tight_layout()
-    plt.savefig('../images/summary_statistics.png', dpi=300, bbox_inches='tight')
+    fig.savefig('../images/summary_statistics.png', dpi=300, bbox_inches='tight')
     print("Summary statistics chart saved as 'summary_statistics.png'")
     return fig
 
-def create_detailed_analysis(df):
+def create_detailed_analysis(df, fig=None):
     """Create detailed analysis charts"""
-    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 10))
+    fig, ((ax1, ax2), (ax3, ax4)) = subplots_2x2(fig, (16, 10))
     
     # 1. Time vs Memory Trade-off
     ax1.scatter(df['ID_vector_Memory_bytes'], df['ID_vector_Time_ns'], 
@@ -211,13 +224,10 @@ def create_detailed_analysis(df):
     ax2.grid(True, alpha=0.3)
     
     # 3. Performance Heatmap
-    # Normalize values for better visualization
-    norm_speed_us = df['Speedup_vs_unordered_set_s'] / df['Speedup_vs_unordered_set_s'].max()
-    norm_speed_v = df['Speedup_vs_vector'] / df['Speedup_vs_vector'].max()
-    norm_mem_us = (1 - df['Memory_Ratio_vs_unordered_set_s']) / (1 - df['Memory_Ratio_vs_unordered_set_s']).max()
-    norm_mem_v = (1 - df['Memory_Ratio_vs_vector']) / abs(1 - df['Memory_Ratio_vs_vector']).max()
-    
-    heatmap_data = np.array([norm_speed_us, norm_speed_v, norm_mem_us, norm_mem_v]).T
+    # Normalize each column by its largest magnitude for better visualization
+    cols = np.column_stack([df['Speedup_vs_unordered_set_s'], df['Speedup_vs_vector'],
+                            1 - df['Memory_Ratio_vs_unordered_set_s'], 1 - df['Memory_Ratio_vs_vector']])
+    heatmap_data = cols / np.maximum(np.abs(cols).max(axis=0, keepdims=True), 1e-12)
     
     im = ax3.imshow(heatmap_data, cmap='RdYlGn', aspect='auto')
     ax3.set_xticks(range(4))
@@ -227,7 +237,7 @@ def create_detailed_analysis(df):
     ax3.set_title('Normalized Performance Heatmap')
     
     # Add colorbar
-    cbar = plt.colorbar(im, ax=ax3)
+    cbar = fig.colorbar(im, ax=ax3)
     cbar.set_label('Normalized Performance (0=worst, 1=best)')
     
     # 4. Cumulative advantages
@@ -244,8 +254,7 @@ def create_detailed_analysis(df):
     ax4.legend()
     ax4.grid(True, alpha=0.3)
     
-    plt.tight_layout()
-    plt.savefig('../images/detailed_analysis.png', dpi=300, bbox_inches='tight')
+    fig.savefig('../images/detailed_analysis.png', dpi=300, bbox_inches='tight')
     print("Detailed analysis chart saved as 'detailed_analysis.png'")
     return fig
 
@@ -322,10 +331,16 @@ def main():
     print(f"Loaded {len(df)} benchmark results")
     print("\nGenerating visualizations...")
     
-    # Create all visualizations
-    fig1 = create_performance_comparison(df)
-    fig2 = create_summary_statistics(df)
-    fig3 = create_detailed_analysis(df)
+    # Create all visualizations; headless runs only save, so one canvas is reused
+    if HEADLESS:
+        fig = plt.figure(constrained_layout=True)
+        for create in (create_performance_comparison, create_summary_statistics, create_detailed_analysis):
+            create(df, fig)
+        plt.close(fig)
+    else:
+        create_performance_comparison(df)
+        create_summary_statistics(df)
+        create_detailed_analysis(df)
     
     # Generate report
     generate_report(df)
@@ -339,8 +354,9 @@ def main():
     print("  • performance_report.txt - Detailed text report")
     print("="*60)
     
-    # Display plots
-    plt.show()
+    # Display plots (nothing to show when rendering headless)
+    if not HEADLESS:
+        plt.show()
 
 if __name__ == "__main__":
     main()
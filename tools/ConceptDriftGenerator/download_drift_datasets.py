@@ -1,6 +1,7 @@
 import openml
 import pandas as pd
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # List of datasets mentioned in "Extremely Simple Streaming Random Forests" and common concept drift benchmarks
 datasets = {
@@ -14,29 +15,53 @@ datasets = {
 }
 
 output_dir = "datasets"
+# Output format: "csv" (default, what the data_quantization tool reads) or
+# "parquet" (smaller and much faster to re-read in visualize_drift.py)
+FORMAT = os.environ.get("DRIFT_FORMAT", "csv").lower()
 if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 
 print(f"Downloading datasets to {os.path.abspath(output_dir)}...")
 
-for name, dataset_id in datasets.items():
-    try:
-        print(f"Downloading {name} (ID: {dataset_id})...")
-        dataset = openml.datasets.get_dataset(dataset_id)
-        X, y, categorical_indicator, attribute_names = dataset.get_data(
-            target=dataset.default_target_attribute,
-            dataset_format="dataframe"
-        )
-        
-        # Combine features and target
-        df = pd.concat([X, y], axis=1)
-        
-        # Save to CSV
-        output_path = os.path.join(output_dir, f"{name}.csv")
-        df.to_csv(output_path, index=False)
-        print(f"Saved {name} to {output_path}")
-        
-    except Exception as e:
-        print(f"Error downloading {name}: {e}")
+def fetch(name, dataset_id):
+    """Download one dataset and return its (features, target) frames."""
+    print(f"Downloading {name} (ID: {dataset_id})...")
+    dataset = openml.datasets.get_dataset(dataset_id)
+    X, y, categorical_indicator, attribute_names = dataset.get_data(
+        target=dataset.default_target_attribute,
+        dataset_format="dataframe"
+    )
+    return X, y
+
+def write_parquet(X, y, output_path):
+    """Write features+target straight to Parquet through one Arrow table."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    # Appending the target column avoids the pd.concat copy of the whole frame
+    table = pa.Table.from_pandas(X, preserve_index=False)
+    table = table.append_column(str(y.name), pa.Array.from_pandas(y))
+    pq.write_table(table, output_path, compression="snappy")
+
+# Downloads are network-bound, so fetch all datasets concurrently and
+# write each one from the main thread as soon as it arrives
+with ThreadPoolExecutor(max_workers=len(datasets)) as executor:
+    futures = {executor.submit(fetch, name, dataset_id): name for name, dataset_id in datasets.items()}
+    for future in as_completed(futures):
+        name = futures[future]
+        try:
+            X, y = future.result()
+            
+            if FORMAT == "parquet":
+                output_path = os.path.join(output_dir, f"{name}.parquet")
+                write_parquet(X, y, output_path)
+            else:
+                # Combine features and target
+                output_path = os.path.join(output_dir, f"{name}.csv")
+                pd.concat([X, y], axis=1).to_csv(output_path, index=False)
+            print(f"Saved {name} to {output_path}")
+            
+        except Exception as e:
+            print(f"Error downloading {name}: {e}")
 
 print("\nDone! You can now use these datasets with the data_quantization tool.")
@@ -1,13 +1,29 @@
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # figures are only saved; also keeps worker processes GUI-free
 import matplotlib.pyplot as plt
 import seaborn as sns
 import json
 import os
 import numpy as np
-from sklearn.decomposition import PCA
-from scipy.stats import wasserstein_distance, skew
-from scipy.spatial.distance import euclidean
+from sklearn.decomposition import PCA, IncrementalPCA
+from scipy.stats import skew
 import glob
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Optional: JIT-compiled window kernel (falls back to NumPy when numba is missing)
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# Optional: multithreaded pyarrow CSV parser (falls back to pandas' C engine)
+try:
+    import pyarrow
+    CSV_READ_OPTS = {'engine': 'pyarrow'}
+except ImportError:
+    CSV_READ_OPTS = {'engine': 'c', 'memory_map': True}
 
 def load_config(config_path):
     with open(config_path, 'r') as f:
@@ -17,11 +33,124 @@ def load_config(config_path):
             return [c for c in configs if not c.get('name', '').startswith('_')]
         return configs
 
+def feature_matrix(df):
+    """Feature columns (everything but the label) as one contiguous float32 array."""
+    label_col = 'label' if 'label' in df.columns else 'class'
+    features = [col for col in df.columns if col != label_col]
+    arr = np.ascontiguousarray(df[features].to_numpy(dtype=np.float32))
+    
+    # Missing/non-finite entries would poison every histogram range and mean:
+    # impute them once with the column mean of the finite values
+    bad = ~np.isfinite(arr)
+    if bad.any():
+        counts = (~bad).sum(axis=0)
+        sums = np.where(bad, 0.0, arr).sum(axis=0)
+        col_means = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+        arr[bad] = col_means[np.nonzero(bad)[1]]
+    return arr
+
+# Cap on points sent to the PCA scatter (rendering cost is O(points))
+PCA_MAX_POINTS = 2000
+
+# Above this many rows the projection is fitted incrementally in batches
+INCREMENTAL_PCA_ROWS = 50000
+PCA_BATCH_SIZE = 10000
+
+# Histogram resolution for the divergence panel
+HELLINGER_BINS = 20
+WASSERSTEIN_BINS = 200
+
 def hellinger_distance(p, q):
-    """Calculates Hellinger distance between two discrete distributions."""
-    return np.sqrt(1 - np.sum(np.sqrt(p * q)))
+    """Calculates Hellinger distance between discrete distributions (last axis)."""
+    return np.sqrt(np.maximum(1 - np.sum(np.sqrt(p * q), axis=-1), 0.0))
+
+def window_bin_counts(codes, starts, window_size, nbins):
+    """Histogram of codes[s:s + window_size] for every window start s.
+
+    Counts are accumulated once per segment between window boundaries, so
+    each window histogram is the difference of two prefix sums.
+    """
+    ends = starts + window_size
+    bounds = np.unique(np.concatenate([starts, ends]))
+    segment = np.searchsorted(bounds, np.arange(len(codes)), side='right')
+    counts = np.bincount(segment * nbins + codes, minlength=(len(bounds) + 1) * nbins)
+    prefix = counts.reshape(-1, nbins).cumsum(axis=0)
+    return prefix[np.searchsorted(bounds, ends)] - prefix[np.searchsorted(bounds, starts)]
+
+def bin_codes(values, bin_edges):
+    """Map values to histogram bin indices (last bin closed, like np.histogram).
+
+    Edges are uniform, so the bin is a scaled floor rather than a binary search.
+    """
+    nbins = len(bin_edges) - 1
+    lo, hi = bin_edges[0], bin_edges[-1]
+    codes = ((values - lo) * (nbins / (hi - lo))).astype(np.int64)
+    return np.clip(codes, 0, nbins - 1)
+
+if njit is not None:
+    @njit(cache=True, fastmath=True, parallel=True)
+    def _window_distances_kernel(w_codes, h_codes, cdf_ref, p, starts, window_size, w_step):
+        """Per-window Wasserstein/Hellinger from pre-binned codes (compiled)."""
+        n = starts.shape[0]
+        w_nbins = cdf_ref.shape[0]
+        h_nbins = p.shape[0]
+        w_dists = np.empty(n)
+        h_dists = np.empty(n)
+        for i in prange(n):
+            w_counts = np.zeros(w_nbins)
+            h_counts = np.zeros(h_nbins)
+            for j in range(starts[i], starts[i] + window_size):
+                w_counts[w_codes[j]] += 1.0
+                h_counts[h_codes[j]] += 1.0
+            cum = 0.0
+            total = 0.0
+            for b in range(w_nbins):
+                cum += w_counts[b]
+                total += abs(cum / window_size - cdf_ref[b])
+            w_dists[i] = total * w_step
+            norm = 1.0 / (window_size + 1e-10)
+            bc = 0.0
+            for b in range(h_nbins):
+                bc += np.sqrt(p[b] * h_counts[b] * norm)
+            h_dists[i] = np.sqrt(max(1.0 - bc, 0.0))
+        return w_dists, h_dists
+
+    # Warm up the JIT so the first plot doesn't pay the compile cost
+    _window_distances_kernel(np.zeros(2, dtype=np.int64), np.zeros(2, dtype=np.int64),
+                             np.ones(1), np.ones(1), np.zeros(1, dtype=np.int64), 2, 1.0)
+else:
+    _window_distances_kernel = None
 
-def plot_distance_over_time(ax, df, config):
+def window_distances(values, ref_len, starts, window_size):
+    """Wasserstein and Hellinger distance of every window against the reference block.
+
+    Wasserstein is integrated over the empirical CDFs on a fine uniform grid,
+    Hellinger uses the coarser HELLINGER_BINS histogram.
+    """
+    w_edges = np.histogram_bin_edges(values, bins=WASSERSTEIN_BINS)
+    w_codes = bin_codes(values, w_edges)
+    w_step = float(w_edges[1] - w_edges[0])
+    cdf_ref = np.cumsum(np.bincount(w_codes[:ref_len], minlength=WASSERSTEIN_BINS)) / ref_len
+
+    h_edges = np.histogram_bin_edges(values, bins=HELLINGER_BINS)
+    h_codes = bin_codes(values, h_edges)
+    p = np.bincount(h_codes[:ref_len], minlength=HELLINGER_BINS).astype(np.float64)
+    p /= p.sum() + 1e-10
+
+    if _window_distances_kernel is not None:
+        return _window_distances_kernel(w_codes, h_codes, cdf_ref, p, starts, window_size, w_step)
+
+    # Wasserstein: |CDF_ref - CDF_win| summed over the grid
+    cdf_win = np.cumsum(window_bin_counts(w_codes, starts, window_size, WASSERSTEIN_BINS), axis=1) / window_size
+    w_dists = np.abs(cdf_win - cdf_ref).sum(axis=1) * w_step
+
+    # Hellinger: normalized histograms sharing the column's bin edges
+    q = window_bin_counts(h_codes, starts, window_size, HELLINGER_BINS).astype(np.float64)
+    q /= q.sum(axis=1, keepdims=True) + 1e-10
+    h_dists = hellinger_distance(p, q)
+    return w_dists, h_dists
+
+def plot_distance_over_time(ax, df, config, arr=None):
     """1. Distribution Distance / Divergence over Time"""
     name = config['name']
     burn_in = config.get('burn_in', 0)
@@ -40,42 +169,27 @@ def plot_distance_over_time(ax, df, config):
         ref_len = min(burn_in, len(df) // 4)
     else:
         ref_len = min(500, len(df) // 4)
-    ref_data = df.iloc[:ref_len][features]
-    
-    distances = []
-    indices = []
     
-    for start in range(0, len(df) - window_size, step):
-        current_window = df.iloc[start : start + window_size][features]
-        
-        # Wasserstein Distance (average over features)
-        try:
-            w_dist = np.mean([wasserstein_distance(ref_data[col], current_window[col]) for col in features])
-        except:
-            w_dist = 0.0
-        
-        # Hellinger Distance (proxy using histograms)
-        h_dists = []
-        for col in features:
-            try:
-                bins = np.histogram_bin_edges(df[col], bins=20)
-                p, _ = np.histogram(ref_data[col], bins=bins, density=True)
-                q, _ = np.histogram(current_window[col], bins=bins, density=True)
-                # Normalize to sum to 1 for Hellinger
-                p = p / (p.sum() + 1e-10)
-                q = q / (q.sum() + 1e-10)
-                h_dists.append(hellinger_distance(p, q))
-            except:
-                h_dists.append(0.0)
-        h_dist = np.mean(h_dists) if h_dists else 0.0
-        
-        distances.append({'wasserstein': w_dist, 'hellinger': h_dist})
-        indices.append(start + window_size // 2)
-    
-    if not distances:
+    # Windows are len(df) // 10 rows wide: under 10 rows they would be empty
+    starts = np.arange(0, len(df) - window_size, step)
+    if window_size == 0 or len(starts) == 0 or not features:
         ax.text(0.5, 0.5, 'Insufficient data', ha='center', va='center', transform=ax.transAxes)
         return
     
+    # All windows at once per feature, then average over features
+    w_sum = np.zeros(len(starts))
+    h_sum = np.zeros(len(starts))
+    if arr is None:
+        arr = feature_matrix(df)
+    # Feature-major copy so each column scan reads contiguous float32 memory
+    for column in np.ascontiguousarray(arr.T):
+        w_dists, h_dists = window_distances(column, ref_len, starts, window_size)
+        w_sum += w_dists
+        h_sum += h_dists
+    
+    distances = {'wasserstein': w_sum / len(features), 'hellinger': h_sum / len(features)}
+    indices = starts + window_size // 2
+    
     dist_df = pd.DataFrame(distances, index=indices)
     
     ax.plot(dist_df['wasserstein'], label='Wasserstein Distance', marker='o', markersize=3)
@@ -140,39 +254,34 @@ def plot_distance_over_time(ax, df, config):
     ax.legend(fontsize=8, loc='best')
     ax.grid(True, alpha=0.3)
 
-def plot_centroid_drift(ax, df, config):
+def plot_centroid_drift(ax, df, config, arr=None):
     """2. Centroid Distance over Time"""
     name = config['name']
     burn_in = config.get('burn_in', 0)
     
-    # Get feature columns
-    label_col = 'label' if 'label' in df.columns else 'class'
-    features = [col for col in df.columns if col != label_col]
-    
     # Reference centroid
     if burn_in > 0:
         ref_len = min(burn_in, len(df) // 4)
     else:
         ref_len = min(500, len(df) // 4)
-    ref_centroid = df.iloc[:ref_len][features].mean().values
+    if arr is None:
+        arr = feature_matrix(df)
+    ref_centroid = arr[:ref_len].mean(axis=0)
     
     window_size = min(100, len(df) // 10)
     step = max(10, window_size // 5)
-    centroid_dists = []
-    indices = []
-    
-    for start in range(0, len(df) - window_size, step):
-        try:
-            cur_centroid = df.iloc[start : start + window_size][features].mean().values
-            dist = euclidean(ref_centroid, cur_centroid)
-            centroid_dists.append(dist)
-            indices.append(start + window_size // 2)
-        except:
-            pass
-    
-    if not centroid_dists:
+    
+    starts = np.arange(0, len(df) - window_size, step)
+    if window_size == 0 or len(starts) == 0:
         ax.text(0.5, 0.5, 'Insufficient data', ha='center', va='center', transform=ax.transAxes)
         return
+    
+    # Rolling window means by prefix-sum differencing (float64 to limit drift)
+    cum = np.zeros((len(arr) + 1, arr.shape[1]))
+    np.cumsum(arr, axis=0, dtype=np.float64, out=cum[1:])
+    means = (cum[starts + window_size] - cum[starts]) / window_size
+    centroid_dists = np.linalg.norm(means - ref_centroid, axis=1)
+    indices = starts + window_size // 2
         
     ax.plot(indices, centroid_dists, color='purple', linewidth=2, label='||μ_t - μ_ref||')
     
@@ -203,8 +312,8 @@ def plot_centroid_drift(ax, df, config):
     ax.legend(fontsize=8)
     ax.grid(True, alpha=0.3)
 
-def plot_pca_projection(ax, df, config):
-    """3. PCA Projection with Time Color"""
+def plot_pca_projection(ax, df, config, arr=None, max_points=PCA_MAX_POINTS):
+    """3. PCA Projection with Time Color (max_points=None plots every row)"""
     name = config['name']
     burn_in = config.get('burn_in', 0)
     
@@ -212,26 +321,39 @@ def plot_pca_projection(ax, df, config):
     label_col = 'label' if 'label' in df.columns else 'class'
     features = [col for col in df.columns if col != label_col]
     
+    if arr is None:
+        arr = feature_matrix(df)
+    
     # Subsample for large datasets to improve performance
-    if len(df) > 2000:
-        df_sample = df.sample(n=2000, random_state=42).sort_index()
+    # (uniform stride keeps the rows time-ordered without a sort)
+    if max_points is not None and len(df) > max_points:
+        sample_idx = np.linspace(0, len(df) - 1, num=max_points).astype(np.int64)
     else:
-        df_sample = df
+        sample_idx = np.arange(len(df))
     
     if burn_in > 0:
         ref_len = min(burn_in, len(df) // 4)
     else:
         ref_len = min(500, len(df) // 4)
-    ref_centroid = df.iloc[:ref_len][features].mean().values
+    ref_centroid = arr[:ref_len].mean(axis=0)
 
     # PCA Projection with Time Color (2D for combined plot)
     try:
         n_comp = min(2, len(features))
-        pca = PCA(n_components=n_comp)
-        pca_result = pca.fit_transform(df_sample[features])
+        data = arr[sample_idx]
+        if len(data) < INCREMENTAL_PCA_ROWS:
+            # Only the top components are needed: randomized range finder
+            pca = PCA(n_components=n_comp, svd_solver='randomized', iterated_power=4, random_state=42)
+            pca_result = pca.fit_transform(data)
+        else:
+            # Bounded memory: O(batch * features) instead of O(rows * features)
+            pca = IncrementalPCA(n_components=n_comp, batch_size=PCA_BATCH_SIZE)
+            for chunk in np.array_split(data, max(1, len(data) // PCA_BATCH_SIZE)):
+                pca.partial_fit(chunk)
+            pca_result = pca.transform(data)
         
         # Create time-based colors
-        time_colors = np.array(df_sample.index) / len(df)
+        time_colors = sample_idx / len(df)
         
         sc = ax.scatter(pca_result[:, 0], pca_result[:, 1], 
                         c=time_colors, cmap='viridis', s=15, alpha=0.6, edgecolors='none')
@@ -240,11 +362,12 @@ def plot_pca_projection(ax, df, config):
         cbar.ax.tick_params(labelsize=8)
         
         # Mark Centroids
-        ref_pca = pca.transform(ref_centroid.reshape(1, -1))
+        # Project centroids directly (pca.transform without the input checks)
+        ref_pca = ((ref_centroid - pca.mean_) @ pca.components_.T)[None, :]
         
         if burn_in > 0 and burn_in < len(df):
-            after_centroid = df.iloc[burn_in:][features].mean().values
-            after_pca = pca.transform(after_centroid.reshape(1, -1))
+            after_centroid = arr[burn_in:].mean(axis=0)
+            after_pca = ((after_centroid - pca.mean_) @ pca.components_.T)[None, :]
             
             ax.scatter(ref_pca[0, 0], ref_pca[0, 1], 
                        color='red', marker='X', s=150, label='Pre-Drift μ', 
@@ -292,29 +415,30 @@ def plot_label_distribution_over_time(ax, df, config):
     window_size = min(200, len(df) // 10)
     step = max(20, window_size // 4)
     
-    labels = sorted(df[label_col].unique())
+    # Categorical codes index the (sorted) classes; no-op when loaded as category
+    cat = df[label_col].astype('category')
+    labels = cat.cat.categories
+    codes = cat.cat.codes.to_numpy()
     num_labels = len(labels)
     
     # Use distinct colors for up to 10 classes
     colors = plt.cm.tab10(np.linspace(0, 1, min(10, num_labels)))
     
-    history = {label: [] for label in labels}
-    indices = []
-    
-    for start in range(0, len(df) - window_size, step):
-        window = df.iloc[start : start + window_size][label_col]
-        counts = window.value_counts(normalize=True)
-        for label in labels:
-            history[label].append(counts.get(label, 0.0))
-        indices.append(start + window_size // 2)
-    
-    if not indices:
+    starts = np.arange(0, len(df) - window_size, step)
+    if window_size == 0 or len(starts) == 0:
         ax.text(0.5, 0.5, 'Insufficient data', ha='center', va='center', transform=ax.transAxes)
         return
+    
+    # Window class frequencies from one-hot prefix sums: cum[end] - cum[start]
+    onehot = codes[:, None] == np.arange(num_labels)
+    cum = np.zeros((len(df) + 1, num_labels), dtype=np.int64)
+    np.cumsum(onehot, axis=0, out=cum[1:])
+    freqs = (cum[starts + window_size] - cum[starts]) / window_size
+    indices = starts + window_size // 2
         
     for i, label in enumerate(labels):
         color = colors[i % len(colors)]
-        ax.plot(indices, history[label], label=f'Class {label}', 
+        ax.plot(indices, freqs[:, i], label=f'Class {label}', 
                 marker='o', markersize=2, linewidth=2, color=color)
     
     # Mark drift points with gradient for gradual drift
@@ -345,10 +469,27 @@ def plot_label_distribution_over_time(ax, df, config):
     ax.legend(fontsize=8, loc='best', ncol=max(1, num_labels // 4))
     ax.grid(True, alpha=0.3)
 
+def load_dataset(path):
+    """Load a drift dataset from Parquet or CSV (by extension)."""
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    # Features as float32; the label (last column) is parsed with its
+    # natural type and only then made categorical, so numeric classes sort
+    # as numbers (a 'category' dtype at parse time sorts them as text)
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    dtype = {col: np.float32 for col in header[:-1]}
+    try:
+        df = pd.read_csv(path, dtype=dtype, **CSV_READ_OPTS)
+    except ValueError:
+        # Non-numeric feature columns (e.g. some downloaded datasets)
+        return pd.read_csv(path)
+    df[header[-1]] = df[header[-1]].astype('category')
+    return df
+
 def plot_drift(csv_path, config, output_dir):
     """Generate combined 4-panel drift analysis plot"""
     try:
-        df = pd.read_csv(csv_path)
+        df = load_dataset(csv_path)
         name = config['name']
         os.makedirs(output_dir, exist_ok=True)
         
@@ -372,10 +513,13 @@ def plot_drift(csv_path, config, output_dir):
         title += f"Samples: {config.get('n_instances', len(df))}, Burn-in: {config.get('burn_in', 0)}"
         fig.suptitle(title, fontsize=16, fontweight='bold')
         
+        # Materialize the feature block once and share it across panels
+        arr = feature_matrix(df)
+        
         # Generate all 4 plots
-        plot_distance_over_time(axes[0, 0], df, config)
-        plot_centroid_drift(axes[0, 1], df, config)
-        plot_pca_projection(axes[1, 0], df, config)
+        plot_distance_over_time(axes[0, 0], df, config, arr)
+        plot_centroid_drift(axes[0, 1], df, config, arr)
+        plot_pca_projection(axes[1, 0], df, config, arr)
         plot_label_distribution_over_time(axes[1, 1], df, config)
         
         plt.tight_layout(rect=[0, 0.03, 1, 0.96])
@@ -392,6 +536,33 @@ def plot_drift(csv_path, config, output_dir):
         import traceback
         traceback.print_exc()
 
+def find_dataset(datasets_dir, config):
+    """Path of the dataset file for a config (Parquet first), or None"""
+    name = config.get('name', 'unknown')
+    drift_type = config.get('type', 'abrupt')
+    
+    # Find matching dataset file (with various suffixes)
+    candidates = []
+    for ext in ('parquet', 'csv'):
+        candidates += [
+            os.path.join(datasets_dir, f"{name}.{ext}"),
+            os.path.join(datasets_dir, f"{name}_{drift_type}_noise.{ext}"),
+            os.path.join(datasets_dir, f"{name}_{drift_type}_noise_redundant.{ext}"),
+        ]
+    
+    # Also check for any file starting with the name
+    for ext in ('parquet', 'csv'):
+        candidates.extend(glob.glob(os.path.join(datasets_dir, f"{name}*.{ext}")))
+    
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+def _plot_drift_star(args):
+    """Picklable plot_drift(*args) wrapper for ProcessPoolExecutor.map"""
+    return plot_drift(*args)
+
 if __name__ == "__main__":
     base_dir = os.path.dirname(os.path.abspath(__file__))
     config_path = os.path.join(base_dir, "parameters.json")
@@ -413,38 +584,27 @@ if __name__ == "__main__":
     
     datasets_dir = os.path.join(base_dir, "datasets")
     
-    # Process each configuration
-    processed = 0
+    # Resolve each configuration to a dataset file
+    tasks = []
     skipped = 0
     
     for config in configs:
         name = config.get('name', 'unknown')
-        
-        # Find matching CSV file (with various suffixes)
-        csv_candidates = [
-            os.path.join(datasets_dir, f"{name}.csv"),
-            os.path.join(datasets_dir, f"{name}_{config.get('type', 'abrupt')}_noise.csv"),
-            os.path.join(datasets_dir, f"{name}_{config.get('type', 'abrupt')}_noise_redundant.csv"),
-        ]
-        
-        # Also check for any file starting with the name
-        pattern = os.path.join(datasets_dir, f"{name}*.csv")
-        csv_candidates.extend(glob.glob(pattern))
-        
-        csv_path = None
-        for candidate in csv_candidates:
-            if os.path.exists(candidate):
-                csv_path = candidate
-                break
+        csv_path = find_dataset(datasets_dir, config)
         
         if csv_path:
-            plot_drift(csv_path, config, output_dir)
-            processed += 1
+            tasks.append((csv_path, config, output_dir))
         else:
             print(f"⚠ Warning: No dataset found for '{name}'")
-            print(f"  Tried: {name}.csv, {name}_*.csv")
+            print(f"  Tried: {name}.parquet/.csv, {name}_*.parquet/.csv")
             skipped += 1
     
+    # Plots are independent and CPU-bound: render them on all cores.
+    # 'spawn' because forking after numba has started its thread pool hangs.
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn')) as executor:
+        list(executor.map(_plot_drift_star, tasks))
+    processed = len(tasks)
+    
     print()
     print("=" * 60)
     print(f"Complete: {processed} visualizations generated, {skipped} skipped")
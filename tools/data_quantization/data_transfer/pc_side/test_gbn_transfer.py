@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Regression tests for the Go-Back-N chunk loop of the PC-side transfer scripts.
+
+A scripted fake serial port stands in for the ESP32: it accepts chunks in
+order only and NACKs everything else, so a rejected chunk is followed by
+replies for the later chunks that were already in flight. No hardware needed:
+
+    python3 -m unittest test_gbn_transfer
+"""
+
+import io
+import os
+import struct
+import sys
+import tempfile
+import unittest
+import binascii
+from collections import deque
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import transfer_dataset
+import transfer_dp_file
+import unified_transfer
+
+WINDOW = 4
+NUM_CHUNKS = 10
+
+
+class FakeBoard:
+    """In-order receiver speaking the V2 or the unified protocol over a fake port."""
+
+    def __init__(self, unified=False, reject=()):
+        self.timeout = 5
+        self.reject = set(reject)  # offsets NACKed the first time they arrive
+        self.replies = deque()
+        self.files = {}
+        self.duplicates = 0  # frames for chunks the board had already accepted
+        self._rx = bytearray()
+        self._board = self._unified_board() if unified else self._v2_board()
+        next(self._board)
+
+    # --- serial.Serial surface used by the scripts ---
+    def write(self, data):
+        self._rx += data
+        next(self._board)
+        return len(data)
+
+    def readline(self):
+        return self.replies.popleft() if self.replies else b""  # timed out
+
+    def read_until(self, expected=b"\n"):
+        return self.readline()
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        pass
+
+    # --- receiver sketch ---
+    def _reply(self, line):
+        self.replies.append(line + b"\n")
+
+    def _take(self, n):
+        while len(self._rx) < n:
+            yield
+        data = bytes(self._rx[:n])
+        del self._rx[:n]
+        return data
+
+    def _line(self):
+        while b"\n" not in self._rx:
+            yield
+        i = self._rx.index(b"\n")
+        line = bytes(self._rx[:i])
+        del self._rx[:i + 1]
+        return line
+
+    def _chunk(self, data, got, header):
+        off, length, crc = struct.unpack('<III', header)
+        payload = yield from self._take(length)
+        if off < got:
+            self.duplicates += 1
+        if off != got or off in self.reject or binascii.crc32(payload) != crc:
+            self.reject.discard(off)
+            self._reply(b"NACK %d" % off)
+            return got
+        data[off:off + length] = payload
+        self._reply(b"ACK %d" % off)
+        return got + length
+
+    def _v2_board(self):
+        while True:
+            line = yield from self._line()
+            assert line == b"TRANSFER_V2", line
+            name_len, = struct.unpack('<I', (yield from self._take(4)))
+            name = (yield from self._take(name_len)).decode()
+            size, file_crc, _ = struct.unpack('<III', (yield from self._take(12)))
+            self._reply(b"READY_V2")
+            data, got = bytearray(size), 0
+            while got < size:
+                got = yield from self._chunk(data, got, (yield from self._take(12)))
+            # Anything but the end command here is a chunk resent too late
+            line = yield from self._line()
+            ok = line == b"TRANSFER_END" and binascii.crc32(data) == file_crc
+            self.files[name] = bytes(data)
+            self._reply(b"TRANSFER_COMPLETE" if ok else b"ERROR " + line[:16])
+
+    def _unified_board(self):
+        header = unified_transfer.CMD_HEADER
+        while True:
+            packet = yield from self._take(len(header) + 1)
+            assert packet.startswith(header), packet
+            command = packet[-1]
+            if command == unified_transfer.CMD_START_SESSION:
+                name_len = (yield from self._take(1))[0]
+                yield from self._take(name_len)
+                self._reply(b"READY")
+            elif command == unified_transfer.CMD_FILE_INFO:
+                name_len = (yield from self._take(1))[0]
+                name = (yield from self._take(name_len)).decode()
+                size, = struct.unpack('<I', (yield from self._take(4)))
+                if size:
+                    yield from self._take(8)  # file CRC, chunk size
+                self._reply(b"ACK")
+                data, got = bytearray(size), 0
+                while got < size:
+                    packet = yield from self._take(len(header) + 1)
+                    assert packet == unified_transfer.CHUNK_PREFIX, packet
+                    got = yield from self._chunk(data, got, (yield from self._take(12)))
+                self.files[name] = bytes(data)
+            elif command == unified_transfer.CMD_FILE_CHUNK:
+                # Chunk of a file that is already complete
+                yield from self._chunk(bytearray(), 0, (yield from self._take(12)))
+                self.duplicates += 1
+            elif command == unified_transfer.CMD_END_SESSION:
+                self._reply(b"OK")
+
+
+class GoBackNTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # Retry back-off and boot waits are not needed against the fake
+        patcher = mock.patch('time.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _make_file(self, name, chunk_size):
+        path = Path(self.tmp.name) / name
+        path.write_bytes(os.urandom(chunk_size * NUM_CHUNKS + 17))
+        return path
+
+    def _run_standalone(self, module, transfer):
+        path = self._make_file("model_nml.bin", module.CHUNK_SIZE)
+        # Chunk 1 is rejected while chunks 2-4 are still on the wire
+        board = FakeBoard(reject={module.CHUNK_SIZE})
+        with mock.patch.object(module.serial, 'Serial', return_value=board), \
+                redirect_stdout(io.StringIO()):
+            transfer(path, "/dev/null", window=WINDOW)
+        self.assertEqual(board.files[path.name], path.read_bytes())
+        self.assertEqual(board.duplicates, 0)
+        self.assertFalse(board.replies)
+
+    def test_dataset_nack_followed_by_in_flight_replies(self):
+        self._run_standalone(transfer_dataset, transfer_dataset.transfer_file)
+
+    def test_dp_file_nack_followed_by_in_flight_replies(self):
+        self._run_standalone(transfer_dp_file, transfer_dp_file.transfer_csv_file)
+
+    def test_unified_nack_followed_by_in_flight_replies(self):
+        chunk_size = unified_transfer.CHUNK_SIZE
+        first = self._make_file("model_qtz.bin", chunk_size)
+        second = self._make_file("model_nml.bin", chunk_size)
+        board = FakeBoard(unified=True, reject={chunk_size})
+        with redirect_stdout(io.StringIO()):
+            # The second FILE_INFO must get its own ACK, not a stale chunk reply
+            for path in (first, second):
+                self.assertTrue(unified_transfer.transfer_file(
+                    board, path, "/" + path.name, window=WINDOW, chunk_size=chunk_size))
+        for path in (first, second):
+            self.assertEqual(board.files["/" + path.name], path.read_bytes())
+        self.assertEqual(board.duplicates, 0)
+        self.assertFalse(board.replies)
+
+    def test_unified_nack_line_is_not_an_ack(self):
+        board = FakeBoard(unified=True)
+        board.replies.extend([b"NACK 0\n"])
+        with redirect_stdout(io.StringIO()):
+            self.assertFalse(unified_transfer.wait_for_response(board, unified_transfer.RESP_ACK))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,22 +26,24 @@ except ImportError:
     def get_user_chunk_size(config_file_path=None, default=220):
         return default
 
+# IEEE CRC-32 as used by the protocol; fastcrc's SIMD implementation when
+# installed (pip install fastcrc), zlib's table-driven one otherwise
+try:
+    from fastcrc import crc32 as _fastcrc32
+    _crc32 = _fastcrc32.iso_hdlc
+except ImportError:
+    _crc32 = binascii.crc32
+
 # CHUNK_SIZE is now automatically extracted from Rf_board_config.h
 CHUNK_SIZE = get_user_chunk_size(default=220)  # Auto-synced with Rf_board_config.h
-CHUNK_DELAY = 0.02  # seconds
 MAX_RETRIES = 5
+PROGRESS_INTERVAL = 0.1  # seconds between progress line updates
 
 def _readline_with_timeout(ser, timeout_s=5.0):
-    """Read a line with a soft timeout; returns stripped string (can be empty)."""
-    end_time = time.time() + timeout_s
-    line = b""
-    while time.time() < end_time:
-        part = ser.readline()
-        if part:
-            line = part
-            break
-        time.sleep(0.01)
-    return line.decode(errors='ignore').strip()
+    """Read a line, blocking at most timeout_s; returns stripped string (can be empty)."""
+    if ser.timeout != timeout_s:
+        ser.timeout = timeout_s  # reconfigures the port, so only on change
+    return ser.readline().decode(errors='ignore').strip()
 
 def find_file(model_name):
     """Find the quantizer binary file in the ../../data/result folder"""
@@ -61,19 +63,22 @@ def transfer_qtz_file(file_path, port, baudrate=115200):
 
     try:
         ser = serial.Serial(port, baudrate, timeout=5)
-        time.sleep(2)  # Wait for ESP32 to initialize
-
-        # Read the file as binary
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
+        boot_deadline = time.time() + 2  # the file is CRC'd while the ESP32 boots
 
-        file_size = len(file_data)
+        file_size = os.path.getsize(file_path)
         filename = file_path.name
 
         print(f"Transferring {filename} ({file_size} bytes)...")
 
-        # Compute full file CRC32
-        file_crc = binascii.crc32(file_data) & 0xFFFFFFFF
+        # Compute full file CRC32 with a running CRC over blocks
+        # (the file is streamed, never held in memory as a whole)
+        file_crc = 0
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                file_crc = _crc32(block, file_crc)
+        file_crc &= 0xFFFFFFFF
+
+        time.sleep(max(0.0, boot_deadline - time.time()))  # Wait for ESP32 to initialize
 
         # Handshake and metadata (V2 protocol)
         ser.reset_input_buffer()
@@ -94,46 +99,51 @@ def transfer_qtz_file(file_path, port, baudrate=115200):
 
         print("ESP32 ready, sending file data with CRC and ACKs...")
 
-        # Send file data in chunks with per-chunk CRC and ACK/NACK
+        # Send file data in chunks with per-chunk CRC and ACK/NACK,
+        # reading each chunk from disk as it goes out
         bytes_sent = 0
-
-        for offset in range(0, file_size, CHUNK_SIZE):
-            chunk = file_data[offset:offset + CHUNK_SIZE]
-            chunk_len = len(chunk)
-            chunk_crc = binascii.crc32(chunk) & 0xFFFFFFFF
-            header = struct.pack('<III', offset, chunk_len, chunk_crc)
-
-            success = False
-            for attempt in range(1, MAX_RETRIES + 1):
-                ser.write(header)
-                ser.write(chunk)
-                ser.flush()
-
-                # Wait for ACK/NACK
-                line = _readline_with_timeout(ser, timeout_s=5.0)
-                if line.startswith("ACK "):
-                    try:
-                        ack_off = int(line.split()[1])
-                    except Exception:
-                        ack_off = -1
-                    if ack_off == offset:
-                        success = True
-                        break
-                elif line.startswith("NACK "):
-                    if line:
-                        print(f"   ↩ {line}")
-                    # Retry
-                    continue
-                # Anything else: small delay and retry
-                time.sleep(0.05)
-
-            if not success:
-                raise Exception(f"Chunk transfer failed at offset {offset}")
-
-            bytes_sent += chunk_len
-            progress = (bytes_sent / file_size) * 100
-            print(f"\rProgress: {progress:.1f}% ({bytes_sent}/{file_size} bytes)", end="")
-            time.sleep(CHUNK_DELAY)
+        last_report = 0.0
+        with open(file_path, 'rb') as src:
+            for offset in range(0, file_size, CHUNK_SIZE):
+                chunk = src.read(CHUNK_SIZE)
+                chunk_len = len(chunk)
+                chunk_crc = _crc32(chunk) & 0xFFFFFFFF
+                # Framed once, resent as-is; one write -> one USB transfer
+                frame = struct.pack('<III', offset, chunk_len, chunk_crc) + chunk
+
+                success = False
+                for attempt in range(1, MAX_RETRIES + 1):
+                    ser.write(frame)
+                    ser.flush()
+
+                    # Wait for ACK/NACK
+                    line = _readline_with_timeout(ser, timeout_s=5.0)
+                    if line.startswith("ACK "):
+                        try:
+                            ack_off = int(line.split()[1])
+                        except Exception:
+                            ack_off = -1
+                        if ack_off == offset:
+                            success = True
+                            break
+                    elif line.startswith("NACK "):
+                        if line:
+                            print(f"   ↩ {line}")
+                        # Retry
+                        continue
+                    # Anything else: small delay and retry
+                    time.sleep(0.05)
+
+                if not success:
+                    raise Exception(f"Chunk transfer failed at offset {offset}")
+
+                bytes_sent += chunk_len
+                now = time.time()
+                if now - last_report >= PROGRESS_INTERVAL or bytes_sent == file_size:
+                    last_report = now
+                    progress = (bytes_sent / file_size) * 100
+                    print(f"\rProgress: {progress:.1f}% ({bytes_sent}/{file_size} bytes)", end="", flush=True)
+                # No inter-chunk sleep: the per-chunk ACK already paces the sender
 
         # End transfer
         ser.write(b"TRANSFER_END\n")
@@ -3,12 +3,16 @@
 # Usage: python3 transfer_dataset.py --model_name <model_name> --port <serial_port>
 # example: python3 transfer_dataset.py --model_name model_name --port /dev/ttyACM0
 # example: python3 transfer_dataset.py -m model_name -p /dev/ttyACM0
+# example: python3 transfer_dataset.py -m model_name -p /dev/ttyUSB0 -b 921600
 # Automatically finds files in ../../data/result/ folder
 
 import os
 import sys
 import time
+import mmap
 import serial
+import re
+import random
 import struct
 import binascii
 from pathlib import Path
@@ -22,6 +26,14 @@ except ImportError:
     def get_user_chunk_size(config_file_path=None, default=220):
         return default
 
+# IEEE CRC-32 as used by the protocol; fastcrc's SIMD implementation when
+# installed (pip install fastcrc), zlib's table-driven one otherwise
+try:
+    from fastcrc import crc32 as _fastcrc32
+    _crc32 = _fastcrc32.iso_hdlc
+except ImportError:
+    _crc32 = binascii.crc32
+
 # CHUNK_SIZE is now automatically extracted from Rf_board_config.h
 # This ensures synchronization with ESP32 side configuration.
 # The value is determined by USER_CHUNK_SIZE in Rf_board_config.h
@@ -35,8 +47,20 @@ except ImportError:
 #   - ESP32-S3:    256 bytes (larger CDC buffer available)
 #   - ESP32:       256 bytes (standard board, good throughput)
 CHUNK_SIZE = get_user_chunk_size(default=220)  # Auto-synced with Rf_board_config.h
-CHUNK_DELAY = 0.02  # seconds between chunks (V2 uses ACKs, so keep small)
 MAX_RETRIES = 5
+PROGRESS_INTERVAL = 0.1  # seconds between progress line updates
+RETRY_BACKOFF = 0.02     # seconds before the first resend, doubled per retry
+RETRY_BACKOFF_MAX = 0.5  # seconds
+# Chunks allowed in flight before waiting for an ACK (1 = stop-and-wait).
+# Larger windows hide the ACK round-trip but rely on the board buffering
+# the extra chunks; keep 1 unless the receiver sketch is known to cope.
+WINDOW = 1
+# Upper bound for a chunk size offered by the board ("READY_V2 MAX_CHUNK=<n>").
+# Boards that reply a bare READY_V2 keep the CHUNK_SIZE sent in the metadata.
+MAX_NEGOTIATED_CHUNK = 4096
+CHUNK_HEADER = struct.Struct('<III')  # offset, length, CRC32 of each chunk
+# "ACK <off>" / "NACK <off>" chunk replies
+_REPLY_RE = re.compile(r"(ACK|NACK) (\d+)")
 
 def find_file(filename):
     """Find the file in the ../../data/result folder"""
@@ -49,98 +73,168 @@ def find_file(filename):
     else:
         raise FileNotFoundError(f"File {filename} not found in {result_dir}")
 
+def _retry_delay(failures):
+    """Back-off before resend number `failures`: exponential, capped, with jitter."""
+    return min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** (failures - 1)) * random.uniform(0.5, 1.5)
+
 def _readline_with_timeout(ser, timeout_s=5.0):
-    """Read a line with a soft timeout; returns stripped string (can be empty)."""
-    end_time = time.time() + timeout_s
-    line = b""
-    while time.time() < end_time:
-        part = ser.readline()
-        if part:
-            line = part
-            break
-        time.sleep(0.01)
-    return line.decode(errors='ignore').strip()
-
-
-def transfer_file(file_path, port, baudrate=115200):
+    """Read a line, blocking at most timeout_s; returns stripped string (can be empty)."""
+    if ser.timeout != timeout_s:
+        ser.timeout = timeout_s  # reconfigures the port, so only on change
+    return ser.readline().decode(errors='ignore').strip()
+
+
+def _set_low_latency(ser):
+    """Ask the UART bridge driver not to batch replies (ASYNC_LOW_LATENCY, Linux only)."""
+    # FTDI/CP210x drivers otherwise hold incoming bytes for up to 16 ms,
+    # which lands on every ACK turn-around. Native USB CDC has no such timer.
+    if hasattr(ser, 'set_low_latency_mode'):
+        try:
+            ser.set_low_latency_mode(True)
+        except (ValueError, OSError):
+            pass  # driver does not support TIOCSSERIAL
+
+
+def _frame_chunks(file_data, chunk_size):
+    """Split file_data into <III>-headed chunk frames; returns (offsets, frames)."""
+    offsets = list(range(0, len(file_data), chunk_size))
+    mv = memoryview(file_data)
+    chunks = (mv[off:off + chunk_size] for off in offsets)
+    # Header and payload go out in a single write per chunk
+    frames = [CHUNK_HEADER.pack(off, len(chunk), _crc32(chunk) & 0xFFFFFFFF) + chunk
+              for off, chunk in zip(offsets, chunks)]
+    mv.release()
+    return offsets, frames
+
+
+def transfer_file(file_path, port, baudrate=115200, window=WINDOW):
     """Transfer binary file to ESP32"""
     print(f"Opening serial port {port} at {baudrate} baud...")
 
     try:
         ser = serial.Serial(port, baudrate, timeout=5)
-        time.sleep(2)  # Wait for ESP32 to initialize
+        _set_low_latency(ser)
+        boot_deadline = time.time() + 2  # the file is prepared while the ESP32 boots
 
-        # Read the binary file
+        # Map the binary file rather than reading it: the CRC pass and the
+        # chunk framing below read straight from the page cache
         with open(file_path, 'rb') as f:
-            file_data = f.read()
+            file_size = os.fstat(f.fileno()).st_size
+            file_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if file_size else b""
 
-        file_size = len(file_data)
         filename = file_path.name
 
         print(f"Transferring {filename} ({file_size} bytes)...")
 
-        # Compute full file CRC32
-        file_crc = binascii.crc32(file_data) & 0xFFFFFFFF
+        # Compute full file CRC32 and frame every chunk up front, so resends
+        # and the send loop are pure I/O
+        file_crc = _crc32(file_data) & 0xFFFFFFFF
+        offsets, frames = _frame_chunks(file_data, CHUNK_SIZE)
+
+        time.sleep(max(0.0, boot_deadline - time.time()))  # Wait for ESP32 to initialize
 
         # Handshake and metadata (V2 protocol)
         ser.reset_input_buffer()
-        ser.write(b"TRANSFER_V2\n")
-        time.sleep(0.05)
-
         filename_bytes = filename.encode('utf-8')
-        ser.write(struct.pack('<I', len(filename_bytes)))
-        ser.write(filename_bytes)
-        ser.write(struct.pack('<I', file_size))
-        ser.write(struct.pack('<I', file_crc))
-        ser.write(struct.pack('<I', CHUNK_SIZE))
+        # Command line and metadata in one write; the board reads the
+        # binary fields from its RX buffer after the newline
+        ser.write(b"TRANSFER_V2\n"
+                  + struct.pack('<I', len(filename_bytes)) + filename_bytes
+                  + struct.pack('<III', file_size, file_crc, CHUNK_SIZE))
 
-        # Wait for ESP32 ready signal
+        # Wait for ESP32 ready signal, optionally carrying a larger chunk size
         response = _readline_with_timeout(ser, timeout_s=8.0)
-        if response != "READY_V2":
+        fields = response.split()
+        if not fields or fields[0] != "READY_V2":
             raise Exception(f"Unexpected response: {response}")
+        chunk_size = CHUNK_SIZE
+        for field in fields[1:]:
+            if field.startswith("MAX_CHUNK="):
+                try:
+                    offered = int(field.split("=", 1)[1])
+                except ValueError:
+                    continue
+                if offered > chunk_size:
+                    chunk_size = min(offered, MAX_NEGOTIATED_CHUNK)
+                    print(f"ESP32 accepts {offered}-byte chunks, using {chunk_size}")
+        if chunk_size != CHUNK_SIZE:
+            offsets, frames = _frame_chunks(file_data, chunk_size)
+        if file_size:
+            file_data.close()
 
         print("ESP32 ready, sending file data with CRC and ACKs...")
 
-        # Send file data in chunks with per-chunk CRC and ACK/NACK
+        # Send file data in chunks with per-chunk CRC and ACK/NACK.
+        # Go-Back-N: up to `window` chunks are in flight; a NACK, timeout or
+        # unexpected reply for the oldest one resends from that chunk.
+        acks = [f"ACK {off}" for off in offsets]
+        base = 0        # oldest unacknowledged chunk
+        next_idx = 0    # next chunk to put on the wire
+        failures = 0
+        outstanding = 0  # chunks written whose reply has not been read yet
+        last_report = 0.0
         bytes_sent = 0
 
-        for offset in range(0, file_size, CHUNK_SIZE):
-            chunk = file_data[offset:offset + CHUNK_SIZE]
-            chunk_len = len(chunk)
-            chunk_crc = binascii.crc32(chunk) & 0xFFFFFFFF
-            header = struct.pack('<III', offset, chunk_len, chunk_crc)
-
-            success = False
-            for attempt in range(1, MAX_RETRIES + 1):
-                ser.write(header)
-                ser.write(chunk)
-                ser.flush()
-
-                # Wait for ACK/NACK
-                line = _readline_with_timeout(ser, timeout_s=5.0)
-                if line.startswith("ACK "):
-                    try:
-                        ack_off = int(line.split()[1])
-                    except Exception:
-                        ack_off = -1
-                    if ack_off == offset:
-                        success = True
-                        break
-                elif line.startswith("NACK "):
-                    if line:
-                        print(f"   ↩ {line}")
-                    # Retry
-                    continue
-                # Anything else: small delay and retry
-                time.sleep(0.05)
+        while base < len(offsets):
+            # Everything the window allows goes out in one write
+            end = min(len(offsets), base + window)
+            if next_idx < end:
+                ser.write(b"".join(frames[next_idx:end]))
+                outstanding += end - next_idx
+                next_idx = end
+            # No ser.flush() here: it would tcdrain() the port, while the
+            # kernel can finish sending the window as we block on the next ACK
+
+            # Wait for ACK/NACK of the oldest chunk in flight
+            offset = offsets[base]
+            line = _readline_with_timeout(ser, timeout_s=5.0)
+            if line == acks[base]:
+                # Common case, matched without splitting the line
+                is_ack, is_nack, reply_off = True, False, offset
+            else:
+                m = _REPLY_RE.match(line)
+                is_ack = m is not None and m.group(1) == "ACK"
+                is_nack = m is not None and m.group(1) == "NACK"
+                reply_off = int(m.group(2)) if m else -1
+            if (is_ack or is_nack) and reply_off > offset:
+                # Reply to a copy sent before the last go-back: replies come back
+                # in order, so the oldest chunk's own reply is still ahead
+                continue
+            if is_ack or is_nack:
+                outstanding = max(0, outstanding - 1)
+
+            if is_ack and reply_off == offset:
+                failures = 0
+                base += 1
+                bytes_sent = min(base * chunk_size, file_size)
+                now = time.time()
+                if now - last_report >= PROGRESS_INTERVAL or bytes_sent == file_size:
+                    last_report = now
+                    progress = (bytes_sent / file_size) * 100
+                    print(f"\rProgress: {progress:.1f}% ({bytes_sent}/{file_size} bytes)", end="", flush=True)
+                continue
+
+            if (is_ack or is_nack) and 0 <= reply_off < offset:
+                # Late duplicate for a chunk that is already acknowledged
+                continue
+
+            if is_nack:
+                print(f"   ↩ {line}")
 
-            if not success:
+            failures += 1
+            if failures >= MAX_RETRIES:
                 raise Exception(f"Chunk transfer failed at offset {offset}")
+            # NACK, timeout or garbage: let the receiver drain before resending
+            time.sleep(_retry_delay(failures))
+            next_idx = base  # go back and resend from the oldest chunk
+            # Replies still due for the abandoned copies are skipped above, and a
+            # board that drops out-of-order frames never sends them: count afresh
+            outstanding = 0
 
-            bytes_sent += chunk_len
-            progress = (bytes_sent / file_size) * 100
-            print(f"\rProgress: {progress:.1f}% ({bytes_sent}/{file_size} bytes)", end="")
-            time.sleep(CHUNK_DELAY)
+        # A late reply accepted after a timeout leaves the resent copies'
+        # replies behind the last ACK; read them before TRANSFER_END
+        while outstanding > 0 and _readline_with_timeout(ser, timeout_s=5.0):
+            outstanding -= 1
 
         # End transfer
         ser.write(b"TRANSFER_END\n")
@@ -167,6 +261,11 @@ def main():
     parser = argparse.ArgumentParser(description="Transfer binary dataset files from PC to ESP32")
     parser.add_argument('--model_name', '-m', required=True, help='Name of the model for dataset file')
     parser.add_argument('--port', '-p', required=True, help='Serial port for ESP32')
+    # Only UART bridges (CP210x/CH34x/FTDI) honour this; native USB CDC ignores it.
+    # Must match Serial.begin() in the board sketch.
+    parser.add_argument('--baud', '-b', type=int, default=115200, help='Serial baud rate (default: 115200)')
+    parser.add_argument('--window', '-w', type=int, default=WINDOW,
+                        help=f'Chunks in flight before waiting for an ACK (default: {WINDOW})')
     args = parser.parse_args()
 
     model_name = args.model_name
@@ -178,7 +277,7 @@ def main():
     try:
         file_path = find_file(filename)
         print(f"Found file: {file_path}")
-        transfer_file(file_path, port)
+        transfer_file(file_path, port, args.baud, max(1, args.window))
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
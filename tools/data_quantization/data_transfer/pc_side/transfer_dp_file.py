@@ -13,6 +13,8 @@ import serial
 import time
 import sys
 import os
+import re
+import random
 import struct
 import binascii
 from pathlib import Path
@@ -26,22 +28,37 @@ except ImportError:
     def get_user_chunk_size(config_file_path=None, default=220):
         return default
 
+# IEEE CRC-32 as used by the protocol; fastcrc's SIMD implementation when
+# installed (pip install fastcrc), zlib's table-driven one otherwise
+try:
+    from fastcrc import crc32 as _fastcrc32
+    _crc32 = _fastcrc32.iso_hdlc
+except ImportError:
+    _crc32 = binascii.crc32
+
 # CHUNK_SIZE is now automatically extracted from Rf_board_config.h
 CHUNK_SIZE = get_user_chunk_size(default=220)  # Auto-synced with Rf_board_config.h
-CHUNK_DELAY = 0.02  # seconds
 MAX_RETRIES = 5
+PROGRESS_INTERVAL = 0.1  # seconds between progress line updates
+RETRY_BACKOFF = 0.02     # seconds before the first resend, doubled per retry
+RETRY_BACKOFF_MAX = 0.5  # seconds
+# Chunks allowed in flight before waiting for an ACK (1 = stop-and-wait).
+# Larger windows hide the ACK round-trip but rely on the board buffering
+# the extra chunks; keep 1 unless the receiver sketch is known to cope.
+WINDOW = 1
+CHUNK_HEADER = struct.Struct('<III')  # offset, length, CRC32 of each chunk
+# "ACK <off>" / "NACK <off>" chunk replies
+_REPLY_RE = re.compile(r"(ACK|NACK) (\d+)")
+
+def _retry_delay(failures):
+    """Back-off before resend number `failures`: exponential, capped, with jitter."""
+    return min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** (failures - 1)) * random.uniform(0.5, 1.5)
 
 def _readline_with_timeout(ser, timeout_s=5.0):
-    """Read a line with a soft timeout; returns stripped string (can be empty)."""
-    end_time = time.time() + timeout_s
-    line = b""
-    while time.time() < end_time:
-        part = ser.readline()
-        if part:
-            line = part
-            break
-        time.sleep(0.01)
-    return line.decode(errors='ignore').strip()
+    """Read a line, blocking at most timeout_s; returns stripped string (can be empty)."""
+    if ser.timeout != timeout_s:
+        ser.timeout = timeout_s  # reconfigures the port, so only on change
+    return ser.readline().decode(errors='ignore').strip()
 
 def find_file(model_name):
     """Find the dataset params CSV file in the ../../data/result folder"""
@@ -55,13 +72,13 @@ def find_file(model_name):
     else:
         raise FileNotFoundError(f"File {filename} not found in {result_dir}")
 
-def transfer_csv_file(file_path, port, baudrate=115200):
+def transfer_csv_file(file_path, port, baudrate=115200, window=WINDOW):
     """Transfer CSV file to ESP32 with V2 protocol (CRC + ACK/NACK)"""
     print(f"Opening serial port {port} at {baudrate} baud...")
 
     try:
         ser = serial.Serial(port, baudrate, timeout=5)
-        time.sleep(2)  # Wait for ESP32 to initialize
+        boot_deadline = time.time() + 2  # the file is prepared while the ESP32 boots
 
         # Read the file as binary
         with open(file_path, 'rb') as f:
@@ -72,8 +89,18 @@ def transfer_csv_file(file_path, port, baudrate=115200):
 
         print(f"Transferring {filename} ({file_size} bytes)...")
 
-        # Compute full file CRC32
-        file_crc = binascii.crc32(file_data) & 0xFFFFFFFF
+        # Frame every chunk with its CRC32, accumulating the full file
+        # CRC32 in the same pass
+        offsets = list(range(0, file_size, CHUNK_SIZE))
+        frames = []
+        file_crc = 0
+        for off in offsets:
+            chunk = file_data[off:off + CHUNK_SIZE]
+            frames.append(CHUNK_HEADER.pack(off, len(chunk), _crc32(chunk) & 0xFFFFFFFF) + chunk)
+            file_crc = _crc32(chunk, file_crc)
+        file_crc &= 0xFFFFFFFF
+
+        time.sleep(max(0.0, boot_deadline - time.time()))  # Wait for ESP32 to initialize
 
         # Handshake and metadata (V2 protocol)
         ser.reset_input_buffer()
@@ -94,46 +121,69 @@ def transfer_csv_file(file_path, port, baudrate=115200):
 
         print("ESP32 ready, sending file data with CRC and ACKs...")
 
-        # Send file data in chunks with per-chunk CRC and ACK/NACK
-        bytes_sent = 0
-
-        for offset in range(0, file_size, CHUNK_SIZE):
-            chunk = file_data[offset:offset + CHUNK_SIZE]
-            chunk_len = len(chunk)
-            chunk_crc = binascii.crc32(chunk) & 0xFFFFFFFF
-            header = struct.pack('<III', offset, chunk_len, chunk_crc)
-
-            success = False
-            for attempt in range(1, MAX_RETRIES + 1):
-                ser.write(header)
-                ser.write(chunk)
-                ser.flush()
-
-                # Wait for ACK/NACK
-                line = _readline_with_timeout(ser, timeout_s=5.0)
-                if line.startswith("ACK "):
-                    try:
-                        ack_off = int(line.split()[1])
-                    except Exception:
-                        ack_off = -1
-                    if ack_off == offset:
-                        success = True
-                        break
-                elif line.startswith("NACK "):
-                    if line:
-                        print(f"   ↩ {line}")
-                    # Retry
-                    continue
-                # Anything else: small delay and retry
-                time.sleep(0.05)
-
-            if not success:
+        # Send file data in chunks with per-chunk CRC and ACK/NACK.
+        # Go-Back-N: up to `window` chunks are in flight; a NACK, timeout or
+        # unexpected reply for the oldest one resends from that chunk.
+        base = 0        # oldest unacknowledged chunk
+        next_idx = 0    # next chunk to put on the wire
+        failures = 0
+        outstanding = 0  # chunks written whose reply has not been read yet
+        last_report = 0.0
+
+        while base < len(offsets):
+            # Everything the window allows goes out in one write
+            end = min(len(offsets), base + window)
+            if next_idx < end:
+                ser.write(b"".join(frames[next_idx:end]))
+                outstanding += end - next_idx
+                next_idx = end
+
+            # Wait for ACK/NACK of the oldest chunk in flight
+            offset = offsets[base]
+            line = _readline_with_timeout(ser, timeout_s=5.0)
+            m = _REPLY_RE.match(line)
+            is_ack = m is not None and m.group(1) == "ACK"
+            is_nack = m is not None and m.group(1) == "NACK"
+            reply_off = int(m.group(2)) if m else -1
+            if (is_ack or is_nack) and reply_off > offset:
+                # Reply to a copy sent before the last go-back: replies come back
+                # in order, so the oldest chunk's own reply is still ahead
+                continue
+            if is_ack or is_nack:
+                outstanding = max(0, outstanding - 1)
+
+            if is_ack and reply_off == offset:
+                failures = 0
+                base += 1
+                bytes_sent = min(base * CHUNK_SIZE, file_size)
+                now = time.time()
+                if now - last_report >= PROGRESS_INTERVAL or bytes_sent == file_size:
+                    last_report = now
+                    progress = (bytes_sent / file_size) * 100
+                    print(f"\rProgress: {progress:.1f}% ({bytes_sent}/{file_size} bytes)", end="", flush=True)
+                continue
+
+            if (is_ack or is_nack) and 0 <= reply_off < offset:
+                # Late duplicate for a chunk that is already acknowledged
+                continue
+
+            if is_nack:
+                print(f"   ↩ {line}")
+
+            failures += 1
+            if failures >= MAX_RETRIES:
                 raise Exception(f"Chunk transfer failed at offset {offset}")
-
-            bytes_sent += chunk_len
-            progress = (bytes_sent / file_size) * 100
-            print(f"\rProgress: {progress:.1f}% ({bytes_sent}/{file_size} bytes)", end="")
-            time.sleep(CHUNK_DELAY)
+            # NACK, timeout or garbage: let the receiver drain before resending
+            time.sleep(_retry_delay(failures))
+            next_idx = base  # go back and resend from the oldest chunk
+            # Replies still due for the abandoned copies are skipped above, and a
+            # board that drops out-of-order frames never sends them: count afresh
+            outstanding = 0
+
+        # A late reply accepted after a timeout leaves the resent copies'
+        # replies behind the last ACK; read them before TRANSFER_END
+        while outstanding > 0 and _readline_with_timeout(ser, timeout_s=5.0):
+            outstanding -= 1
 
         # End transfer
         ser.write(b"TRANSFER_END\n")
@@ -160,6 +210,8 @@ def main():
     parser = argparse.ArgumentParser(description="Dataset Parameters Transfer Script for ESP32")
     parser.add_argument('--model_name', '-m', required=True, help='Name of the model for dataset parameters file')
     parser.add_argument('--port', '-p', required=True, help='Serial port for ESP32')
+    parser.add_argument('--window', '-w', type=int, default=WINDOW,
+                        help=f'Chunks in flight before waiting for an ACK (default: {WINDOW})')
     args = parser.parse_args()
 
     model_name = args.model_name
@@ -168,7 +220,7 @@ def main():
     try:
         file_path = find_file(model_name)
         print(f"Found file: {file_path}")
-        if transfer_csv_file(file_path, port):
+        if transfer_csv_file(file_path, port, window=max(1, args.window)):
             print("✅ SUCCESS: Data sent to ESP32")
         else:
             print("❌ FAILED: Could not send data")
@@ -26,22 +26,24 @@ except ImportError:
     def get_user_chunk_size(config_file_path=None, default=220):
         return default
 
+# IEEE CRC-32 as used by the protocol; fastcrc's SIMD implementation when
+# installed (pip install fastcrc), zlib's table-driven one otherwise
+try:
+    from fastcrc import crc32 as _fastcrc32
+    _crc32 = _fastcrc32.iso_hdlc
+except ImportError:
+    _crc32 = binascii.crc32
+
 # CHUNK_SIZE is now automatically extracted from Rf_board_config.h
 CHUNK_SIZE = get_user_chunk_size(default=220)  # Auto-synced with Rf_board_config.h
-CHUNK_DELAY = 0.02  # seconds
 MAX_RETRIES = 5
+PROGRESS_INTERVAL = 0.1  # seconds between progress line updates
 
 def _readline_with_timeout(ser, timeout_s=5.0):
-    """Read a line with a soft timeout; returns stripped string (can be empty)."""
-    end_time = time.time() + timeout_s
-    line = b""
-    while time.time() < end_time:
-        part = ser.readline()
-        if part:
-            line = part
-            break
-        time.sleep(0.01)
-    return line.decode(errors='ignore').strip()
+    """Read a line, blocking at most timeout_s; returns stripped string (can be empty)."""
+    if ser.timeout != timeout_s:
+        ser.timeout = timeout_s  # reconfigures the port, so only on change
+    return ser.readline().decode(errors='ignore').strip()
 
 def find_file(model_name):
     """Find the quantizer binary file in the ../../data/result folder"""
@@ -61,7 +63,7 @@ def transfer_qtz_file(file_path, port, baudrate=115200):
 
     try:
         ser = serial.Serial(port, baudrate, timeout=5)
-        time.sleep(2)  # Wait for ESP32 to initialize
+        boot_deadline = time.time() + 2  # the file is CRC'd while the ESP32 boots
 
         # Read the file as binary
         with open(file_path, 'rb') as f:
@@ -73,7 +75,9 @@ def transfer_qtz_file(file_path, port, baudrate=115200):
         print(f"Transferring {filename} ({file_size} bytes)...")
 
         # Compute full file CRC32
-        file_crc = binascii.crc32(file_data) & 0xFFFFFFFF
+        file_crc = _crc32(file_data) & 0xFFFFFFFF
+
+        time.sleep(max(0.0, boot_deadline - time.time()))  # Wait for ESP32 to initialize
 
         # Handshake and metadata (V2 protocol)
         ser.reset_input_buffer()
@@ -96,11 +100,12 @@ def transfer_qtz_file(file_path, port, baudrate=115200):
 
         # Send file data in chunks with per-chunk CRC and ACK/NACK
         bytes_sent = 0
+        last_report = 0.0
 
         for offset in range(0, file_size, CHUNK_SIZE):
             chunk = file_data[offset:offset + CHUNK_SIZE]
             chunk_len = len(chunk)
-            chunk_crc = binascii.crc32(chunk) & 0xFFFFFFFF
+            chunk_crc = _crc32(chunk) & 0xFFFFFFFF
             header = struct.pack('<III', offset, chunk_len, chunk_crc)
 
             success = False
@@ -131,9 +136,11 @@ def transfer_qtz_file(file_path, port, baudrate=115200):
                 raise Exception(f"Chunk transfer failed at offset {offset}")
 
             bytes_sent += chunk_len
-            progress = (bytes_sent / file_size) * 100
-            print(f"\rProgress: {progress:.1f}% ({bytes_sent}/{file_size} bytes)", end="")
-            time.sleep(CHUNK_DELAY)
+            now = time.time()
+            if now - last_report >= PROGRESS_INTERVAL or bytes_sent == file_size:
+                last_report = now
+                progress = (bytes_sent / file_size) * 100
+                print(f"\rProgress: {progress:.1f}% ({bytes_sent}/{file_size} bytes)", end="", flush=True)
 
         # End transfer
         ser.write(b"TRANSFER_END\n")
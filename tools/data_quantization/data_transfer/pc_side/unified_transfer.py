@@ -17,10 +17,14 @@ import serial
 import time
 import os
 import sys
+import mmap
+import re
+import random
 import struct
 import binascii
 from pathlib import Path
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 # Import configuration parser to sync with ESP32
 try:
@@ -30,6 +34,14 @@ except ImportError:
     def get_user_chunk_size(config_file_path=None, default=220):
         return default
 
+# IEEE CRC-32 as used by the protocol; fastcrc's SIMD implementation when
+# installed (pip install fastcrc), zlib's table-driven one otherwise
+try:
+    from fastcrc import crc32 as _fastcrc32
+    _crc32 = _fastcrc32.iso_hdlc
+except ImportError:
+    _crc32 = binascii.crc32
+
 # --- Protocol Constants ---
 # Must match the ESP32 receiver sketch
 CMD_HEADER = b"ESP32_XFER"
@@ -37,6 +49,8 @@ CMD_START_SESSION = 0x01
 CMD_FILE_INFO = 0x02
 CMD_FILE_CHUNK = 0x03
 CMD_END_SESSION = 0x04
+CHUNK_PREFIX = CMD_HEADER + struct.pack('B', CMD_FILE_CHUNK)
+CHUNK_HEADER = struct.Struct('<III')  # offset, length, CRC32 of each chunk
 
 RESP_ACK = b"ACK"
 RESP_READY = b"READY"
@@ -56,24 +70,48 @@ RESP_ERROR = b"ERROR"
 #   - ESP32-S3:    256 bytes (larger CDC buffer available)
 #   - ESP32:       256 bytes (standard board, good throughput)
 CHUNK_SIZE = get_user_chunk_size(default=220)  # Auto-synced with Rf_board_config.h
-CHUNK_DELAY = 0.025  # delay between chunks in seconds - V2 uses ACKs, so keep small
+CHUNK_DELAY = 0.025  # back-off in seconds before the first resend, doubled per retry - ACKs already pace the sender
+RETRY_BACKOFF_MAX = 0.5  # seconds
 
 # Timeout settings
 SERIAL_TIMEOUT = 5  # seconds
 ACK_TIMEOUT = 5 # seconds - V2 protocol with explicit ACK/NACK
 MAX_RETRIES = 5
+PROGRESS_INTERVAL = 0.1  # seconds between progress bar redraws
+# Chunks allowed in flight before waiting for an ACK (1 = stop-and-wait).
+# Larger windows hide the ACK round-trip but rely on the board buffering
+# the extra chunks; keep 1 unless the receiver sketch is known to cope.
+WINDOW = 1
+# The START command doubles as a readiness probe: it is re-sent every
+# START_PROBE_TIMEOUT seconds until READY, instead of sleeping for boot.
+START_PROBE_TIMEOUT = 0.5  # seconds
+START_PROBES = 16  # ~8 s in total, as long as the old fixed waits plus READY timeout
+# Upper bound for a chunk size offered by the board ("READY MAX_CHUNK=<n>").
+# Boards that reply a bare READY keep CHUNK_SIZE, which FILE_INFO announces.
+MAX_NEGOTIATED_CHUNK = 4096
+# "ACK <off>" / "NACK <off>" chunk replies
+_REPLY_RE = re.compile(r"(ACK|NACK) (\d+)")
+
+def _retry_delay(failures):
+    """Back-off before resend number `failures`: exponential, capped, with jitter."""
+    return min(RETRY_BACKOFF_MAX, CHUNK_DELAY * 2 ** (failures - 1)) * random.uniform(0.5, 1.5)
 
 def _readline_with_timeout(ser, timeout_s=5.0):
-    """Read a line with a soft timeout; returns stripped string (can be empty)."""
-    end_time = time.time() + timeout_s
-    line = b""
-    while time.time() < end_time:
-        part = ser.readline()
-        if part:
-            line = part
-            break
-        time.sleep(0.01)
-    return line.decode(errors='ignore').strip()
+    """Read a line, blocking at most timeout_s; returns stripped string (can be empty)."""
+    if ser.timeout != timeout_s:
+        ser.timeout = timeout_s  # reconfigures the port, so only on change
+    return ser.readline().decode(errors='ignore').strip()
+
+
+def _set_low_latency(ser):
+    """Ask the UART bridge driver not to batch replies (ASYNC_LOW_LATENCY, Linux only)."""
+    # FTDI/CP210x drivers otherwise hold incoming bytes for up to 16 ms,
+    # which lands on every ACK turn-around. Native USB CDC has no such timer.
+    if hasattr(ser, 'set_low_latency_mode'):
+        try:
+            ser.set_low_latency_mode(True)
+        except (ValueError, OSError):
+            pass  # driver does not support TIOCSSERIAL
 
 
 def get_file_paths(base_name):
@@ -87,32 +125,31 @@ def get_file_paths(base_name):
     }
 
 def wait_for_response(ser, expected_response, timeout=ACK_TIMEOUT, verbose=True):
-    """Wait for a specific response from the ESP32."""
-    start_time = time.time()
+    """Wait for a specific response from the ESP32; returns the line carrying it, or False."""
+    deadline = time.time() + timeout
+    if ser.timeout != timeout:
+        ser.timeout = timeout
     buffer = b""
-    while time.time() - start_time < timeout:
-        if ser.in_waiting > 0:
-            new_data = ser.read(ser.in_waiting)
-            buffer += new_data
-            
-            # Check if we have the expected response
-            if expected_response in buffer:
-                if verbose:
-                    print(f"✅ Got response: {expected_response.decode()}")
-                return True
-                
-            # Check for error response
-            if b"ERROR" in buffer:
-                if verbose:
-                    print(f"❌ ESP32 reported ERROR: {buffer.decode(errors='ignore')}")
-                return False
-                
-            # Clear buffer if it gets too large to prevent memory issues
-            if len(buffer) > 1024:
-                buffer = buffer[-512:]  # Keep only the last 512 bytes
-                
-        time.sleep(0.005)  # Smaller delay for better responsiveness with USB CDC
-        
+    while time.time() < deadline:
+        # Blocks in the driver until a full line arrives or the port times out
+        line = ser.read_until(b"\n")
+        if not line:
+            break
+        buffer = (buffer + line)[-512:]  # keep only the tail for the report below
+
+        # Check if we have the expected response (whole word, so a stale
+        # "NACK <off>" line is not taken for an ACK)
+        if expected_response in line.split():
+            if verbose:
+                print(f"✅ Got response: {expected_response.decode()}")
+            return line
+
+        # Check for error response
+        if b"ERROR" in buffer:
+            if verbose:
+                print(f"❌ ESP32 reported ERROR: {buffer.decode(errors='ignore')}")
+            return False
+
     if verbose:
         print(f"❌ Timeout waiting for '{expected_response.decode()}'. Got: {buffer.decode(errors='ignore')}")
     return False
@@ -121,20 +158,52 @@ def send_command(ser, command, payload=b""):
     """Send a command packet to the ESP32."""
     packet = CMD_HEADER + struct.pack('B', command) + payload
     ser.write(packet)
-    ser.flush()
-    time.sleep(0.01)  # Small delay to ensure command is processed
+    ser.flush()  # callers wait for the reply, which paces the next command
+
+def prepare_file(file_path, chunk_size=CHUNK_SIZE):
+    """Map a file and CRC it; returns (file_size, file_crc, offsets, chunk_crcs, data) or None if missing."""
+    try:
+        file_size = os.path.getsize(file_path)  # one stat() doubles as the existence check
+    except OSError:
+        return None
+    if file_size == 0:
+        return 0, 0, [], [], b""
 
-def transfer_file(ser, file_path, esp32_filename):
-    """Handles the transfer of a single file with V2 protocol (CRC + ACK/NACK)."""
-    if not os.path.exists(file_path):
+    # Map the file data; chunks are sliced from the page cache and copied
+    # only into the packet buffer. The mapping goes away with the last reference.
+    with open(file_path, 'rb') as f:
+        file_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # Per-chunk CRC32s, with the full file CRC32 accumulated in the same
+    # pass while each chunk is still hot in cache
+    mv = memoryview(file_data)  # slice without copying
+    offsets = list(range(0, file_size, chunk_size))
+    crcs = []
+    file_crc = 0
+    for off in offsets:
+        chunk = mv[off:off + chunk_size]
+        crcs.append(_crc32(chunk) & 0xFFFFFFFF)
+        file_crc = _crc32(chunk, file_crc)
+    file_crc &= 0xFFFFFFFF
+    return file_size, file_crc, offsets, crcs, mv
+
+def transfer_file(ser, file_path, esp32_filename, window=WINDOW, chunk_size=CHUNK_SIZE, prepared=None):
+    """Handles the transfer of a single file with V2 protocol (CRC + ACK/NACK).
+
+    `prepared` is the result of prepare_file() for the same path and chunk
+    size, when it was computed ahead of time; otherwise it is done here.
+    """
+    if prepared is None:
+        prepared = prepare_file(file_path, chunk_size)
+    if prepared is None:
         print(f"⚠️  Warning: File not found, skipping: {file_path}")
         return False
-
-    file_size = os.path.getsize(file_path)
+    file_size, file_crc, offsets, crcs, mv = prepared
+    local_name = Path(file_path).name
     
     # Handle case for empty files
     if file_size == 0:
-        print(f"\n🚀 Skipping empty file: {Path(file_path).name}")
+        print(f"\n🚀 Skipping empty file: {local_name}")
         # We still need to inform the ESP32 to create the empty file
         filename_bytes = esp32_filename.encode('utf-8')
         payload = struct.pack('B', len(filename_bytes)) + filename_bytes + struct.pack('<I', 0)
@@ -144,80 +213,119 @@ def transfer_file(ser, file_path, esp32_filename):
             return False
         return True
 
-    # Read the file data
-    with open(file_path, 'rb') as f:
-        file_data = f.read()
-    
-    # Compute full file CRC32
-    file_crc = binascii.crc32(file_data) & 0xFFFFFFFF
-        
-    print(f"\n🚀 Transferring {Path(file_path).name} -> {esp32_filename} ({file_size} bytes)")
+    print(f"\n🚀 Transferring {local_name} -> {esp32_filename} ({file_size} bytes)")
 
     # 1. Send File Info with V2 metadata (filename, size, CRC, chunk_size)
     filename_bytes = esp32_filename.encode('utf-8')
     payload = (struct.pack('B', len(filename_bytes)) + filename_bytes + 
-               struct.pack('<III', file_size, file_crc, CHUNK_SIZE))
+               struct.pack('<III', file_size, file_crc, chunk_size))
     send_command(ser, CMD_FILE_INFO, payload)
 
     if not wait_for_response(ser, RESP_ACK, verbose=False):
         print("❌ ESP32 did not acknowledge file info.")
         return False
 
-    # 2. Send File Chunks with per-chunk CRC and ACK/NACK
+    # 2. Send File Chunks with per-chunk CRC and ACK/NACK.
+    # Go-Back-N: up to `window` chunks are in flight; a NACK, timeout or
+    # unexpected reply for the oldest one resends from that chunk.
     print("Sending file data with CRC and ACKs...")
-    bytes_sent = 0
-
-    for offset in range(0, file_size, CHUNK_SIZE):
-        chunk = file_data[offset:offset + CHUNK_SIZE]
-        chunk_len = len(chunk)
-        chunk_crc = binascii.crc32(chunk) & 0xFFFFFFFF
-        header = struct.pack('<III', offset, chunk_len, chunk_crc)
-
-        success = False
-        for attempt in range(1, MAX_RETRIES + 1):
-            # Send chunk with header
-            send_command(ser, CMD_FILE_CHUNK, header + chunk)
-
-            # Wait for ACK/NACK
-            line = _readline_with_timeout(ser, timeout_s=5.0)
-            if line.startswith("ACK "):
-                try:
-                    ack_off = int(line.split()[1])
-                except Exception:
-                    ack_off = -1
-                if ack_off == offset:
-                    success = True
-                    break
-            elif line.startswith("NACK "):
-                if line:
-                    print(f"   ↩ {line}")
-                # Retry
-                if attempt < MAX_RETRIES:
-                    sys.stdout.write('\n')
-                    print(f"⚠️  Retrying chunk at offset {offset} ({attempt}/{MAX_RETRIES})...")
+    acks = [f"ACK {off}" for off in offsets]
+    # One reusable buffer holding a window's worth of packets back to back,
+    # each CHUNK_PREFIX, <III> header, payload. ser.write() hands the bytes
+    # to the driver before returning, so it can be refilled straight away.
+    payload_at = len(CHUNK_PREFIX) + CHUNK_HEADER.size
+    packet = bytearray((payload_at + chunk_size) * window)
+    packet_view = memoryview(packet)
+    bar_length = 40
+    bar_full, bar_empty = '█' * bar_length, '-' * bar_length
+    last_draw = 0.0
+    base = 0        # oldest unacknowledged chunk
+    next_idx = 0    # next chunk to put on the wire
+    failures = 0
+    outstanding = 0  # chunks written whose reply has not been read yet
+
+    while base < len(offsets):
+        # Everything the window allows goes out in one write
+        end = min(len(offsets), base + window)
+        if next_idx < end:
+            pos = 0
+            for i in range(next_idx, end):
+                offset = offsets[i]
+                chunk = mv[offset:offset + chunk_size]
+                chunk_len = len(chunk)
+                packet[pos:pos + len(CHUNK_PREFIX)] = CHUNK_PREFIX
+                CHUNK_HEADER.pack_into(packet, pos + len(CHUNK_PREFIX), offset, chunk_len, crcs[i])
+                packet[pos + payload_at:pos + payload_at + chunk_len] = chunk
+                pos += payload_at + chunk_len
+            ser.write(packet_view[:pos])
+            outstanding += end - next_idx
+            next_idx = end
+
+        # Wait for ACK/NACK of the oldest chunk in flight
+        offset = offsets[base]
+        line = _readline_with_timeout(ser, timeout_s=5.0)
+        if line == acks[base]:
+            is_ack, is_nack, reply_off = True, False, offset
+        else:
+            m = _REPLY_RE.match(line)
+            is_ack = m is not None and m.group(1) == "ACK"
+            is_nack = m is not None and m.group(1) == "NACK"
+            reply_off = int(m.group(2)) if m else -1
+        if (is_ack or is_nack) and reply_off > offset:
+            # Reply to a copy sent before the last go-back: replies come back
+            # in order, so the oldest chunk's own reply is still ahead
+            continue
+        if is_ack or is_nack:
+            outstanding = max(0, outstanding - 1)
+
+        if is_ack and reply_off == offset:
+            failures = 0
+            base += 1
+
+            # Redraw at most every PROGRESS_INTERVAL, and always for the last chunk
+            bytes_sent = min(base * chunk_size, file_size)
+            now = time.time()
+            if now - last_draw < PROGRESS_INTERVAL and bytes_sent < file_size:
                 continue
-            # Anything else: small delay and retry
-            time.sleep(0.05)
-
-        if not success:
+            last_draw = now
+            progress = (bytes_sent / file_size) * 100
+            filled_len = int(bar_length * bytes_sent // file_size)
+            bar = bar_full[:filled_len] + bar_empty[filled_len:]
+
+            # Use carriage return to stay on the same line
+            sys.stdout.write(f'   [{bar}] {progress:.1f}% complete\r')
+            sys.stdout.flush()
+            continue
+
+        if (is_ack or is_nack) and 0 <= reply_off < offset:
+            # Late duplicate for a chunk that is already acknowledged
+            continue
+
+        failures += 1
+        if is_nack:
+            print(f"   ↩ {line}")
+            if failures < MAX_RETRIES:
+                sys.stdout.write('\n')
+                print(f"⚠️  Retrying chunk at offset {offset} ({failures}/{MAX_RETRIES})...")
+
+        if failures >= MAX_RETRIES:
             sys.stdout.write('\n')
             print(f"❌ Chunk transfer failed at offset {offset} after {MAX_RETRIES} retries")
             return False
-
-        bytes_sent += chunk_len
-        progress = (bytes_sent / file_size) * 100
-        bar_length = 40
-        filled_len = int(bar_length * bytes_sent // file_size)
-        bar = '█' * filled_len + '-' * (bar_length - filled_len)
-        
-        # Use carriage return to stay on the same line
-        sys.stdout.write(f'   [{bar}] {progress:.1f}% complete\r')
-        sys.stdout.flush()
-        
-        time.sleep(CHUNK_DELAY)
+        # NACK, timeout or garbage: let the receiver drain before resending
+        time.sleep(_retry_delay(failures))
+        next_idx = base  # go back and resend from the oldest chunk
+        # Replies still due for the abandoned copies are skipped above, and a
+        # board that drops out-of-order frames never sends them: count afresh
+        outstanding = 0
+
+    # A late reply accepted after a timeout leaves the resent copies'
+    # replies behind the last ACK; read them before the next command
+    while outstanding > 0 and _readline_with_timeout(ser, timeout_s=5.0):
+        outstanding -= 1
 
     sys.stdout.write('\n')
-    print(f"✅ Finished sending file: {Path(file_path).name}")
+    print(f"✅ Finished sending file: {local_name}")
     return True
 
 
@@ -237,11 +345,14 @@ def main():
     parser = argparse.ArgumentParser(description="Unified ESP32 Data Transfer Utility")
     parser.add_argument('--model_name', '-m', required=True, help='Base name of the dataset files')
     parser.add_argument('--port', '-p', required=True, help='Serial port for ESP32')
+    parser.add_argument('--window', '-w', type=int, default=WINDOW,
+                        help=f'Chunks in flight before waiting for an ACK (default: {WINDOW})')
     args = parser.parse_args()
 
     base_name = args.model_name
     port = args.port
     baudrate = 115200
+    window = max(1, args.window)
     
     # Display configuration
     print("\n" + "=" * 50)
@@ -258,29 +369,49 @@ def main():
     try:
         print(f"🔌 Connecting to ESP32 on {port} at {baudrate}bps...")
         with serial.Serial(port, baudrate, timeout=SERIAL_TIMEOUT) as ser:
-            # Clear any pending data and wait for stable connection
-            ser.reset_input_buffer()
-            ser.reset_output_buffer()
-            time.sleep(2)  # Wait for ESP32 to initialize
-            
-            print("🔄 Testing connection stability...")
-            time.sleep(1)
-
-            # 1. Start Session
+            _set_low_latency(ser)
+            # No buffer resets here: nothing is queued on a freshly opened
+            # port, and boot output arriving later is skipped while probing
+
+            # 1. Start Session (repeated until READY while the ESP32 boots)
             print("🤝 Initiating transfer session...")
             # Payload: <basename_len (1B)> <basename (str)>
             basename_bytes = base_name.encode('utf-8')
             payload = struct.pack('B', len(basename_bytes)) + basename_bytes
-            send_command(ser, CMD_START_SESSION, payload)
-
-            if not wait_for_response(ser, RESP_READY):
+            for _ in range(START_PROBES):
+                send_command(ser, CMD_START_SESSION, payload)
+                ready_line = wait_for_response(ser, RESP_READY, timeout=START_PROBE_TIMEOUT, verbose=False)
+                if ready_line:
+                    print(f"✅ Got response: {RESP_READY.decode()}")
+                    break
+            else:
                 print("❌ ESP32 is not ready. Is the correct sketch running?")
                 return
 
-            # 2. Transfer each file
-            transfer_file(ser, files_to_send["quantizer"], f"/{base_name}_qtz.bin")
-            transfer_file(ser, files_to_send["params"], f"/{base_name}_dp.csv")
-            transfer_file(ser, files_to_send["dataset"], f"/{base_name}_nml.bin")
+            # READY may carry the largest chunk the board accepts
+            chunk_size = CHUNK_SIZE
+            for field in ready_line.split():
+                if field.startswith(b"MAX_CHUNK="):
+                    try:
+                        offered = int(field.split(b"=", 1)[1])
+                    except ValueError:
+                        continue
+                    if offered > chunk_size:
+                        chunk_size = min(offered, MAX_NEGOTIATED_CHUNK)
+                        print(f"ESP32 accepts {offered}-byte chunks, using {chunk_size}")
+
+            # 2. Transfer each file. A single background worker maps and
+            # CRCs the files in order, so the next one is ready (and the
+            # large dataset's CRC already done) while the current one is sent.
+            transfers = [
+                (files_to_send["quantizer"], f"/{base_name}_qtz.bin"),
+                (files_to_send["params"], f"/{base_name}_dp.csv"),
+                (files_to_send["dataset"], f"/{base_name}_nml.bin"),
+            ]
+            with ThreadPoolExecutor(max_workers=1) as preparer:
+                prepared = [preparer.submit(prepare_file, path, chunk_size) for path, _ in transfers]
+                for (path, esp32_filename), future in zip(transfers, prepared):
+                    transfer_file(ser, path, esp32_filename, window, chunk_size, future.result())
 
             # 3. End Session
             print("\n🏁 Ending transfer session.")
@@ -6,7 +6,7 @@ This program creates PCA scatter plots to visualize the data dispersion
 before and after quantization for classification datasets.
 
 Usage:
-    python quantization_visualizer.py <model_name>
+    python quantization_visualizer.py <model_name> [--no-show]
 
 The program will look for:
     - Original data: data/<model_name>.csv
@@ -20,33 +20,57 @@ import os
 import sys
 import numpy as np
 import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
 import mpl_toolkits.mplot3d  # Required for 3D projections
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import LabelEncoder
+from scipy import sparse
+
+# pandas parses CSV with the multithreaded pyarrow reader when it is installed
+try:
+    import pyarrow  # noqa: F401
+    CSV_READ_OPTIONS = {'engine': 'pyarrow'}
+except ImportError:
+    CSV_READ_OPTIONS = {'engine': 'c', 'low_memory': False}
 
 
 def load_data(filepath):
     """
     Load CSV data with or without header and class labels in first column.
     
+    The parsed arrays are cached next to the CSV as <file>.npz and reused
+    for as long as the cache is newer than the CSV.
+    
     Returns:
         features: numpy array of feature data
         labels: numpy array of class labels
         label_mapping: dict mapping numeric labels to original string labels (or None)
     """
+    cache_path = f"{filepath}.npz"
+    try:
+        if os.path.getmtime(cache_path) >= os.path.getmtime(filepath):
+            with np.load(cache_path) as cached:
+                features, labels = cached['features'], cached['labels']
+                class_names = cached['classes'].tolist()
+            label_mapping = dict(enumerate(class_names)) if class_names else None
+            return features, labels, label_mapping
+    except Exception:
+        pass  # No cache, stale or unreadable: parse the CSV
+    
     try:
-        # First, try to read as numbers (no header), with low_memory=False to suppress warnings
-        data = pd.read_csv(filepath, header=None, low_memory=False)
-        
         # Check if the first row contains strings (indicating a header)
-        first_row = data.iloc[0]
-        if any(isinstance(val, str) for val in first_row):
-            # Reload with header
-            data = pd.read_csv(filepath, header=0, low_memory=False)
+        first_row = pd.read_csv(filepath, header=None, nrows=1).iloc[0]
+        has_header = any(isinstance(val, str) for val in first_row)
         
-        labels = data.iloc[:, 0].values  # First column is the class label
-        features = data.iloc[:, 1:].values  # Rest are features
+        # Parse the file once, features straight to float32 (plenty for
+        # visualization, and half the bytes through PCA and the scores)
+        feature_types = {col: np.float32 for col in range(1, len(first_row))}
+        data = pd.read_csv(filepath, header=None, skiprows=1 if has_header else 0,
+                           dtype=feature_types, **CSV_READ_OPTIONS)
+        
+        labels = data.iloc[:, 0].to_numpy()  # First column is the class label
+        features = data.iloc[:, 1:].to_numpy(dtype=np.float32)  # Rest are features
         
         # Convert string labels to numeric if needed
         label_mapping = None
@@ -56,6 +80,12 @@ def load_data(filepath):
             labels = le.fit_transform(labels)
             # Create mapping from numeric to original string labels
             label_mapping = {i: label for i, label in enumerate(le.classes_)}
+        
+        try:
+            np.savez(cache_path, features=features, labels=labels,
+                     classes=np.array(list(label_mapping.values()) if label_mapping else [], dtype=str))
+        except OSError as e:
+            print(f"Warning: could not cache {filepath}: {e}")
             
         return features, labels, label_mapping
     except FileNotFoundError:
@@ -79,48 +109,55 @@ def sample_data_for_visualization(features, labels, max_samples_per_class=50, ma
     Returns:
         sampled_features, sampled_labels, sampling_info
     """
-    unique_labels = np.unique(labels)
+    unique_labels, class_codes, label_counts = np.unique(labels, return_inverse=True, return_counts=True)
+    total_classes = len(unique_labels)
+    
+    # Group sample indices by class with one stable sort: each class is a
+    # contiguous, ascending run of `order`, in unique_labels order. Sorting
+    # the class codes as uint16 lets numpy use its O(n) radix sort.
+    if total_classes <= np.iinfo(np.uint16).max:
+        class_codes = class_codes.astype(np.uint16)
+    order = np.argsort(class_codes.ravel(), kind='stable')
+    ends = np.cumsum(label_counts)
+    starts = ends - label_counts
     
     # Limit to max_classes if there are too many
-    if len(unique_labels) > max_classes:
-        # Select the most frequent classes
-        label_counts = [(label, np.sum(labels == label)) for label in unique_labels]
-        label_counts.sort(key=lambda x: x[1], reverse=True)
-        selected_labels = [label for label, _ in label_counts[:max_classes]]
-        
-        # Filter data to only include selected classes
-        mask = np.isin(labels, selected_labels)
-        features = features[mask]
-        labels = labels[mask]
-        unique_labels = np.array(selected_labels)
-    
+    if total_classes > max_classes:
+        # Select the most frequent classes (ties keep label order); the
+        # other classes' runs are simply never read
+        most_frequent = np.argsort(-label_counts, kind='stable')[:max_classes]
+        unique_labels = unique_labels[most_frequent]
+        starts, ends = starts[most_frequent], ends[most_frequent]
+    
+    # One seeded generator per call: reproducible, and the same points in
+    # every view, without touching numpy's global random state
+    rng = np.random.default_rng(42)
     sampled_indices = []
     
-    for label in unique_labels:
-        class_indices = np.where(labels == label)[0]
+    for start, end in zip(starts, ends):
+        class_indices = order[start:end]
         if len(class_indices) > max_samples_per_class:
             # Random sampling for better representation
-            np.random.seed(42)  # For reproducible results
-            selected_indices = np.random.choice(class_indices, max_samples_per_class, replace=False)
+            selected_indices = rng.choice(class_indices, size=max_samples_per_class, replace=False)
         else:
             selected_indices = class_indices
-        sampled_indices.extend(selected_indices)
+        sampled_indices.append(selected_indices)
     
-    sampled_indices = np.array(sampled_indices)
+    sampled_indices = np.concatenate(sampled_indices)
     
     sampling_info = {
-        'original_size': len(features),
+        'original_size': int(np.sum(ends - starts)),
         'sampled_size': len(sampled_indices),
         'samples_per_class': max_samples_per_class,
-        'total_classes': len(unique_labels),
+        'total_classes': total_classes,
         'classes_shown': len(unique_labels),
-        'classes_filtered': len(np.unique(labels)) > max_classes
+        'classes_filtered': total_classes > max_classes
     }
     
     return features[sampled_indices], labels[sampled_indices], sampling_info
 
 
-def create_pca_plot(features, labels, title, ax, class_names=None, view_angle=None, max_samples=500):
+def create_pca_plot(features, labels, title, ax, class_names=None, view_angle=None, max_samples=500, pca=None):
     """
     Create a 3D PCA scatter plot with sampling for better visualization.
     
@@ -132,6 +169,7 @@ def create_pca_plot(features, labels, title, ax, class_names=None, view_angle=No
         class_names: Optional list of class names for legend
         view_angle: Tuple of (elev, azim) for viewing angle
         max_samples: Maximum total samples to display
+        pca: Optional PCA already fitted on features (shared across views)
     """
     # Sample data if too dense
     if len(features) > max_samples:
@@ -148,22 +186,29 @@ def create_pca_plot(features, labels, title, ax, class_names=None, view_angle=No
         if sampling_info['classes_filtered']:
             title += " (showing top 5 classes)"
     
-    # Perform PCA
-    pca = PCA(n_components=3)
-    features_pca = pca.fit_transform(features)  # Use full data for PCA
+    # Perform PCA on the full data unless it was fitted once for all views
+    if pca is None:
+        pca = PCA(n_components=3, random_state=42).fit(features)
     features_viz_pca = pca.transform(features_viz)  # Transform sampled data
     
+    # Map labels to tab10 colors once, as c=labels with cmap='tab10' would
+    # (min..max normalized); the scatter takes the RGBA array directly and
+    # the legend reuses the per-class colors
+    unique_labels, label_codes = np.unique(labels_viz, return_inverse=True)
+    label_range = (unique_labels[-1] - unique_labels[0]) or 1
+    class_colors = plt.cm.tab10((unique_labels - unique_labels[0]) / label_range)
+    
     # Create scatter plot with better styling
     scatter = ax.scatter(
         features_viz_pca[:, 0],
         features_viz_pca[:, 1],
         features_viz_pca[:, 2],
-        c=labels_viz,
+        c=class_colors[label_codes.ravel()],  # Better color map for classification
         s=60,  # Slightly larger points
-        cmap='tab10',  # Better color map for classification
         alpha=0.8,
         edgecolors='white',
-        linewidth=0.5
+        linewidth=0.5,
+        depthshade=False  # no per-draw depth fading; alpha already softens overlap
     )
     
     # Set labels and title
@@ -184,14 +229,12 @@ def create_pca_plot(features, labels, title, ax, class_names=None, view_angle=No
     ax.set_zticklabels([])
     
     # Add legend (smaller for compact layout)
-    unique_labels = np.unique(labels_viz)
     if class_names is None:
         class_names = [f'Class {int(label)}' for label in unique_labels]
     
     # Create legend elements with better colors
     legend_elements = []
-    colors = plt.cm.tab10(np.linspace(0, 1, len(unique_labels)))
-    for i, (label, color) in enumerate(zip(unique_labels, colors)):
+    for i, (label, color) in enumerate(zip(unique_labels, class_colors)):
         legend_elements.append(plt.Line2D([0], [0], marker='o', color='w', 
                                         markerfacecolor=color, markersize=5,
                                         label=class_names[i] if i < len(class_names) else f'Class {int(label)}'))
@@ -313,6 +356,14 @@ RECOMMENDATION:
     return ax1, ax2, ax3
 
 
+def _class_means(features, class_codes, counts):
+    """Per-class mean rows, summed as one sparse (classes x samples) one-hot product."""
+    n_samples = len(class_codes)
+    one_hot = sparse.csr_matrix((np.ones(n_samples), (class_codes, np.arange(n_samples))),
+                                shape=(len(counts), n_samples))
+    return (one_hot @ features) / counts[:, None]
+
+
 def calculate_class_separation_score(features, labels):
     """
     Calculate a score indicating how well-separated the classes are.
@@ -321,99 +372,54 @@ def calculate_class_separation_score(features, labels):
     Returns:
         separation_score: Higher values indicate better separation
     """
-    from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
-    
     try:
-        # Use LDA to calculate separation score
-        lda = LinearDiscriminantAnalysis()
-        lda.fit(features, labels)
-        
-        # Calculate the score based on explained variance ratios
-        explained_variance_ratio = lda.explained_variance_ratio_
-        separation_score = np.sum(explained_variance_ratio)
-        
-        return separation_score
-    except:
-        # Fallback: calculate simple inter/intra class distance ratio
-        unique_labels = np.unique(labels)
-        if len(unique_labels) < 2:
-            return 0.0
+        # LDA explained variance ratios, from the scatter matrices directly:
+        # both are symmetric PSD, so eigh is enough and no projection is built
+        class_ids, inverse = np.unique(labels, return_inverse=True)
+        n_components = min(len(class_ids) - 1, features.shape[1])
+        if n_components < 1:
+            raise ValueError("LDA needs at least two classes")
+        features = np.asarray(features, dtype=np.float64)
+        counts = np.bincount(inverse)
+        class_means = _class_means(features, inverse, counts)
         
-        # Calculate centroids
-        centroids = []
-        for label in unique_labels:
-            class_data = features[labels == label]
-            centroids.append(np.mean(class_data, axis=0))
-        centroids = np.array(centroids)
+        centered = features - class_means[inverse]
+        within_scatter = centered.T @ centered
+        mean_offsets = class_means - features.mean(axis=0)
+        between_scatter = (mean_offsets * counts[:, None]).T @ mean_offsets
         
-        # Inter-class distances
-        inter_distances = []
-        for i in range(len(centroids)):
-            for j in range(i+1, len(centroids)):
-                inter_distances.append(np.linalg.norm(centroids[i] - centroids[j]))
-        mean_inter_distance = np.mean(inter_distances) if inter_distances else 0
-        
-        # Intra-class distances
-        intra_distances = []
-        for label in unique_labels:
-            class_data = features[labels == label]
-            if len(class_data) > 1:
-                centroid = np.mean(class_data, axis=0)
-                for point in class_data:
-                    intra_distances.append(np.linalg.norm(point - centroid))
-        mean_intra_distance = np.mean(intra_distances) if intra_distances else 1
-        
-        # Return ratio (higher is better for classification)
-        separation_score = mean_inter_distance / (mean_intra_distance + 1e-10)
-        return separation_score
-    """
-    Calculate a score indicating how well-separated the classes are.
-    Uses the ratio of between-class to within-class scatter.
-    
-    Returns:
-        separation_score: Higher values indicate better separation
-    """
-    from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
-    
-    try:
-        # Use LDA to calculate separation score
-        lda = LinearDiscriminantAnalysis()
-        lda.fit(features, labels)
+        # Whiten by the within-class scatter, dropping directions without
+        # within-class variance (constant or collinear features), then solve
+        # the symmetric eigenproblem of the whitened between-class scatter
+        w_vals, w_vecs = np.linalg.eigh(within_scatter)
+        keep = w_vals > w_vals.max() * 1e-8
+        whitening = w_vecs[:, keep] / np.sqrt(w_vals[keep])
+        eigenvalues = np.linalg.eigvalsh(whitening.T @ between_scatter @ whitening)[::-1]
         
         # Calculate the score based on explained variance ratios
-        explained_variance_ratio = lda.explained_variance_ratio_
+        explained_variance_ratio = eigenvalues[:n_components] / eigenvalues.sum()
         separation_score = np.sum(explained_variance_ratio)
         
         return separation_score
     except:
         # Fallback: calculate simple inter/intra class distance ratio
-        unique_labels = np.unique(labels)
+        unique_labels, inverse = np.unique(labels, return_inverse=True)
         if len(unique_labels) < 2:
             return 0.0
         
-        # Calculate centroids
-        centroids = []
-        for label in unique_labels:
-            class_data = features[labels == label]
-            centroids.append(np.mean(class_data, axis=0))
-        centroids = np.array(centroids)
+        # Calculate centroids (per-class sums in one pass over the data)
+        features = np.asarray(features, dtype=np.float64)
+        counts = np.bincount(inverse)
+        centroids = _class_means(features, inverse, counts)
         
-        # Inter-class distances
-        inter_distances = []
-        for i in range(len(centroids)):
-            for j in range(i+1, len(centroids)):
-                inter_distances.append(np.linalg.norm(centroids[i] - centroids[j]))
-        mean_inter_distance = np.mean(inter_distances) if inter_distances else 0
+        # Inter-class distances (every centroid pair)
+        pair_i, pair_j = np.triu_indices(len(centroids), k=1)
+        inter_distances = np.linalg.norm(centroids[pair_i] - centroids[pair_j], axis=1)
+        mean_inter_distance = np.mean(inter_distances) if len(inter_distances) else 0
         
-        # Intra-class distances
-        intra_distances = []
-        for label in unique_labels:
-            class_data = features[labels == label]
-            if len(class_data) > 1:
-                centroid = np.mean(class_data, axis=0)
-                for point in class_data:
-                    intra_distances.append(np.linalg.norm(point - centroid))
-        mean_intra_distance = np.mean(intra_distances) if intra_distances else 1
+        # Intra-class distances (classes with a single sample are skipped)
+        intra_distances = np.linalg.norm(features - centroids[inverse], axis=1)[counts[inverse] > 1]
+        mean_intra_distance = np.mean(intra_distances) if len(intra_distances) else 1
         
         # Return ratio (higher is better for classification)
         separation_score = mean_inter_distance / (mean_intra_distance + 1e-10)
@@ -530,8 +536,14 @@ def main():
     parser.add_argument('model_name', help='Name of the model/dataset (without .csv extension)')
     parser.add_argument('--original', help='Path to original CSV file')
     parser.add_argument('--quantized', help='Path to quantized CSV file')
+    parser.add_argument('--no-show', action='store_true',
+                        help='Only save the plot; no interactive window (headless/batch runs)')
     args = parser.parse_args()
     
+    if args.no_show:
+        # Before any figure exists, so no GUI toolkit is ever loaded
+        matplotlib.use('Agg', force=True)
+    
     model_name = args.model_name
     
     # Define file paths
@@ -576,13 +588,19 @@ def main():
         (-90, 0, "Top-front View")
     ]
     
+    # Fit PCA once per dataset; the views only differ in camera angle.
+    # svd_solver='auto' already takes the randomized path for wide data (and
+    # the covariance path for tall data); random_state keeps it reproducible.
+    original_pca = PCA(n_components=3, random_state=42).fit(original_features)
+    quantized_pca = PCA(n_components=3, random_state=42).fit(quantized_features)
+    
     # Row 1: Original data (3 different views)
     original_vars = []
     for i, (elev, azim, view_name) in enumerate(view_angles):
         ax = fig.add_subplot(3, 3, i+1, projection='3d')
         original_var = create_pca_plot(original_features, original_labels, 
                                       f'Original Data - {view_name}', ax, class_names, 
-                                      view_angle=(elev, azim))
+                                      view_angle=(elev, azim), pca=original_pca)
         original_vars.append(original_var)
     
     # Row 2: Quantized data (3 matching views)
@@ -591,7 +609,7 @@ def main():
         ax = fig.add_subplot(3, 3, i+4, projection='3d')
         quantized_var = create_pca_plot(quantized_features, quantized_labels, 
                                        f'Quantized Data - {view_name}', ax, class_names,
-                                       view_angle=(elev, azim))
+                                       view_angle=(elev, azim), pca=quantized_pca)
         quantized_vars.append(quantized_var)
     
     # Row 3: Quantization impact assessment (3 assessment plots)
@@ -610,11 +628,14 @@ def main():
     output_dir = 'plots'
     os.makedirs(output_dir, exist_ok=True)
     output_file = f'{output_dir}/{model_name}_pca_comparison.png'
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    # fig.savefig rather than plt.savefig: pyplot redraws the whole canvas
+    # after saving, which costs a third full render of the six 3D views
+    fig.savefig(output_file, dpi=300, bbox_inches='tight')
     print(f"\nPlot saved as: {output_file}")
     
     # Show plot
-    plt.show()
+    if not args.no_show:
+        plt.show()
 
 
 if __name__ == '__main__':
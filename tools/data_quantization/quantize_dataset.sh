@@ -155,7 +155,7 @@ if [[ "$RUN_VISUALIZATION" == "true" ]]; then
     ORIGINAL_CSV="$CSV_PATH"
     QUANTIZED_CSV="$RESULT_DIR/${BASENAME}_nml.csv"
     
-    if python3 quantization_visualizer.py "$BASENAME" --original "$ORIGINAL_CSV" --quantized "$QUANTIZED_CSV" >/dev/null 2>&1; then
+    if python3 quantization_visualizer.py "$BASENAME" --original "$ORIGINAL_CSV" --quantized "$QUANTIZED_CSV" --no-show >/dev/null 2>&1; then
         :
     else
         echo -e "${YELLOW}⚠️  Visualization failed (run manually: python3 quantization_visualizer.py $BASENAME --original $ORIGINAL_CSV --quantized $QUANTIZED_CSV)${NC}"